@@ -0,0 +1,215 @@
+# Copyright (c) Streamlit Inc. (2018-2022) Snowflake Inc. (2022)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Reusable Altair chart builders for the pizzeria pages, with a memoized
+# Vega-Lite spec layer so identical charts are built and validated once.
+
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+import altair as alt
+import numpy as np
+import pandas as pd
+
+SPEC_CACHE_SIZE = 256
+
+# Default number of marks a point chart may embed before it is binned
+PAYLOAD_MAX_ROWS = 500
+
+_spec_cache = OrderedDict()
+_spec_lock = threading.Lock()
+_transform_lock = threading.Lock()
+
+
+def _add_title(chart, title_name):
+    if title_name:
+        chart = chart.properties(
+            title={
+                "text": [title_name],
+                "fontSize": 12,
+                "fontWeight": "bold"
+            }
+        )
+    return chart
+
+# For simple pie chart with percentage
+def alt_pie(data:pd.DataFrame, value_col:str, color_by:str,
+            title_name:str=None):
+    # Add percentage, on a copy so the caller's frame is left alone
+    data = data.assign(percentage=data[value_col] / data[value_col].sum())
+
+    # Plot normal pie chart
+    chart = alt.Chart(data).mark_arc().encode(
+        theta=alt.Theta(field=value_col, type="quantitative"),
+        color=alt.Color(field=color_by, type="nominal", scale=alt.Scale(scheme='yellowgreenblue')),
+        tooltip=[color_by, value_col, alt.Tooltip('percentage:Q', format='.1%')]
+    ).properties(
+        width=300,
+        height=300
+    )
+    return _add_title(chart, title_name).configure_view(stroke=None)
+
+# Bar chart of value_col per group_col, stacked by color_by, either orientation
+def alt_bar(data:pd.DataFrame, value_col:str, group_col:str, color_by:str, horizontal:bool=True,
+            title_name:str=None, sort_bar:bool=True, show_data:bool=False,
+            color_domain_order:list=None):
+    # Add percentage, on a copy so the caller's frame is left alone
+    total = data.groupby(group_col, observed=True)[value_col].transform('sum')
+    data = data.assign(Total=total, percentage=data[value_col] / total)
+
+    # Label position for boolean category: top of the bar for True, end of the
+    # False segment otherwise, hidden where the bar is too short or too full
+    loc_col = 'X_Loc' if horizontal else 'Y_Loc'
+    if data[color_by].dtype == bool:
+        flag = data[color_by].to_numpy()
+        show = flag | ((data['Total'] > data['Total'].max() * 0.3) & (data[value_col] < data['Total'] * 0.8)).to_numpy()
+        data[loc_col] = np.where(show, np.where(flag, data['Total'], data[value_col]), np.nan)
+
+    # Show dataframe result
+    if show_data:
+        print(data)
+
+    # Change color scheme for different use case
+    if len(data[color_by].unique()) > 5:
+        color_scale = alt.Scale(scheme='category20')
+    elif color_domain_order:
+        color_range = ['#ffffcc', '#a1dab4', '#41b6c4', '#2c7fb8', '#253494']
+        color_scale = alt.Scale(domain=color_domain_order, range=color_range)
+    else:
+        color_scale = alt.Scale(scheme='yellowgreenblue')
+
+    # Sort the color by the color domain
+    color_options = dict(legend=alt.Legend(title=color_by, orient='right'), scale=color_scale)
+    if color_domain_order:
+        color_options['sort'] = color_domain_order
+    coloring = alt.Color('%s:N' % color_by, **color_options)
+
+    # Value and group axes, swapped between the two orientations
+    value_axis, group_axis = ('x', 'y') if horizontal else ('y', 'x')
+    value_enc = alt.X if horizontal else alt.Y
+    group_enc = alt.Y if horizontal else alt.X
+    # Sort the axis
+    sort_by = '-%s' % value_axis if sort_bar else group_axis
+
+    if horizontal:
+        value_field = value_enc('%s:Q' % value_col, axis=alt.Axis(labelAngle=0, title=value_col))
+        group_field = group_enc('%s:N' % group_col, sort=sort_by)
+        order = alt.Order('color_%s_sort_index:Q' % color_by)
+        size = dict(width=500, height=400)
+    else:
+        value_field = value_enc('%s:Q' % value_col)
+        group_field = group_enc('%s:N' % group_col, sort=sort_by, axis=alt.Axis(labelAngle=0, title=group_col))
+        order = alt.Order('color_%s_sort_index:Q' % color_by, sort='descending')
+        size = dict(width=400, height=500)
+
+    # Plot bar chart
+    chart = alt.Chart(data).mark_bar().encode(
+        color=coloring,
+        order=order,
+        tooltip=['%s:N' % color_by, '%s:Q' % value_col, '%s:N' % group_col,
+                 alt.Tooltip('percentage:Q', format='.1%')],
+        **{value_axis: value_field, group_axis: group_field}
+    ).properties(**size)
+
+    # Mark percentage for boolean category
+    if data[color_by].dtype == bool:
+        if horizontal:
+            text_perc = chart.mark_text(align='center', baseline='bottom', dy=5, dx=20)
+        else:
+            text_perc = chart.mark_text(align='center', baseline='middle', dy=-15)
+        text_perc = text_perc.encode(
+            text=alt.Text('percentage:Q', format='.1%'),
+            **{group_axis: '%s:N' % group_col,
+               value_axis: value_enc('%s:Q' % loc_col, axis=alt.Axis(labelAngle=0))}
+        )
+        chart = chart + text_perc
+
+    return _add_title(chart, title_name)
+
+def alt_bar_horizontal(data:pd.DataFrame, x_col:str, y_col:str, color_by:str, **options):
+    return alt_bar(data, x_col, y_col, color_by, horizontal=True, **options)
+
+def alt_bar_vertical(data:pd.DataFrame, x_col:str, y_col:str, color_by:str, **options):
+    return alt_bar(data, x_col, y_col, color_by, horizontal=False, **options)
+
+# Scatter of a count against a price-like axis, colored by a category
+def alt_point(data:pd.DataFrame, x_col:str, y_col:str, color_by:str,
+              title_name:str=None, x_format:str=None):
+    chart = alt.Chart(data).mark_point().encode(
+        x='%s:Q' % x_col,
+        y='%s:Q' % y_col,
+        color='%s:N' % color_by,
+        tooltip=['%s:N' % color_by, alt.Tooltip('%s:Q' % x_col, format=x_format or ''), '%s:Q' % y_col]
+    )
+    return _add_title(chart, title_name)
+
+
+def bin_points(data:pd.DataFrame, x_col:str, y_col:str, color_by:str,
+               max_rows:int=PAYLOAD_MAX_ROWS):
+    """Sum y_col into equal-width x_col bins per color_by when data has too many rows.
+
+    Keeps the embedded Vega-Lite data at about max_rows rows however many
+    distinct prices the order table holds; x_col becomes the bin centre.
+    """
+    if len(data) <= max_rows:
+        return data
+    bins = max(1, max_rows // max(1, data[color_by].nunique()))
+    x = data[x_col].to_numpy(dtype='float64')
+    edges = np.linspace(x.min(), x.max(), bins + 1)
+    centers = (edges[:-1] + edges[1:]) / 2
+    index = np.clip(np.searchsorted(edges, x, side='right') - 1, 0, bins - 1)
+    return (data.assign(**{x_col: centers[index]})
+            .groupby([x_col, color_by], observed=True)[y_col].sum()
+            .reset_index())
+
+
+def payload_size(spec:dict):
+    """Approximate bytes of a Vega-Lite spec, data included, once sent as JSON."""
+    return len(json.dumps(spec, default=str).encode())
+
+
+def frame_hash(data:pd.DataFrame):
+    """Content hash of a frame, including its column names and dtypes."""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(repr([(str(c), str(t)) for c, t in data.dtypes.items()]).encode())
+    digest.update(pd.util.hash_pandas_object(data, index=True).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def chart_spec(builder, data:pd.DataFrame, *args, **options):
+    """Vega-Lite dict of builder(data, *args, **options), memoized process-wide.
+
+    The key is the frame's content hash plus the builder and its options, so a
+    rerun with the same aggregated frame skips spec construction, validation
+    and JSON conversion. Render it with st.vega_lite_chart(spec=...).
+    """
+    key = (builder.__module__, builder.__qualname__, frame_hash(data),
+           repr(args), repr(sorted(options.items())))
+    with _spec_lock:
+        spec = _spec_cache.get(key)
+        if spec is not None:
+            _spec_cache.move_to_end(key)
+    if spec is None:
+        # Altair refuses frames over 5000 rows by default; st.altair_chart never did.
+        # The transformer setting is global, so builds hold a lock while it is lifted
+        with _transform_lock, alt.data_transformers.disable_max_rows():
+            spec = builder(data, *args, **options).to_dict()
+        with _spec_lock:
+            _spec_cache[key] = spec
+            while len(_spec_cache) > SPEC_CACHE_SIZE:
+                _spec_cache.popitem(last=False)
+    # Streamlit pops keys off the top level while marshalling
+    return dict(spec)
@@ -0,0 +1,158 @@
+# Copyright (c) Streamlit Inc. (2018-2022) Snowflake Inc. (2022)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Load generator of the Pizza Bot: N concurrent simulated ordering sessions go
+# through the same turn logic as the page (local parser, context window, reply
+# cache, pooled client), reporting turn latency percentiles and throughput.
+#
+#     python load_test.py --sessions 50 --mock --latency 0.4 --token-rate 50
+
+import argparse
+import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from streamlit.logger import set_log_level
+
+import mock_llm
+from pizza_bot import BACKENDS, SYSTEM_PROMPT, complete, context_window, response_cache
+from pizza_menu import MENU, Order, local_reply
+
+# Turns of a simulated session; some the local parser answers, some go to the model
+SCRIPT = [
+    "Hi!",
+    "{quantity} {size} {pizza} with {topping}",
+    "how much is a {drink}?",
+    "{quantity} {size} {drink}",
+    "Do you have anything gluten free?",
+    "what's my total?",
+    "Delivery please, to {number} Main Street",
+    "I'll pay by card when it arrives",
+]
+
+
+def session_turns(rng):
+    """The SCRIPT filled in with a random order."""
+    choices = dict(
+        quantity=rng.randint(1, 3),
+        size=rng.choice(["large", "medium", "small"]),
+        pizza=rng.choice(list(MENU["Pizzas"])).split()[0].lower(),
+        topping=rng.choice(list(MENU["Toppings"])).lower(),
+        drink=rng.choice(["coke", "sprite"]),
+        number=rng.randint(1, 999),
+    )
+    return [turn.format(**choices) for turn in SCRIPT]
+
+
+def bot_turn(prompt, messages, order, backend, api_key, use_cache):
+    """One customer turn as the page runs it: returns (model, latency, time to first token)."""
+    start = time.perf_counter()
+    messages.append({"role": "user", "content": prompt})
+    reply = local_reply(prompt, order)
+    if reply is not None:
+        messages.append({"role": "assistant", "content": reply})
+        return False, time.perf_counter() - start, None
+
+    tokens = []
+    first_token = None
+    for token in complete(api_key, context_window(messages), backend=backend,
+                          use_cache=use_cache):
+        if first_token is None:
+            first_token = time.perf_counter() - start
+        tokens.append(token)
+    messages.append({"role": "assistant", "content": "".join(tokens)})
+    return True, time.perf_counter() - start, first_token
+
+
+def run_session(seed, runs, backend, api_key, use_cache, think):
+    """Play runs ordering sessions back to back; returns a list of turn results."""
+    rng = random.Random(seed)
+    results = []
+    for _ in range(runs):
+        messages = [{"role": "system", "content": SYSTEM_PROMPT}]
+        order = Order()
+        for prompt in session_turns(rng):
+            try:
+                results.append(bot_turn(prompt, messages, order, backend, api_key, use_cache))
+            except Exception as error:
+                results.append(error)
+                break
+            if think:
+                time.sleep(rng.uniform(0.5, 1.5) * think)
+    return results
+
+
+def percentiles(values):
+    if not values:
+        return "n/a"
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return f"p50 {p50 * 1000:.0f} ms, p95 {p95 * 1000:.0f} ms, p99 {p99 * 1000:.0f} ms"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the Pizza Bot turn logic.")
+    parser.add_argument("--sessions", type=int, default=20, help="concurrent sessions")
+    parser.add_argument("--runs", type=int, default=1,
+                        help="ordering sessions each simulated customer plays in a row")
+    parser.add_argument("--backend", choices=list(BACKENDS), default="Local mock")
+    parser.add_argument("--api-key", default=os.environ.get("OPENAI_API_KEY"))
+    parser.add_argument("--no-cache", action="store_true", help="bypass the reply cache")
+    parser.add_argument("--think", type=float, default=0.0,
+                        help="mean seconds a customer takes between turns")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--mock", action="store_true",
+                        help="serve the Local mock backend from this process; it then "
+                             "shares the GIL with the sessions, run mock_llm.py apart "
+                             "for tighter numbers")
+    parser.add_argument("--latency", type=float, default=mock_llm.LATENCY)
+    parser.add_argument("--token-rate", type=float, default=mock_llm.TOKEN_RATE)
+    parser.add_argument("--reply-tokens", type=int, default=mock_llm.REPLY_TOKENS)
+    args = parser.parse_args()
+
+    # Per-turn bot logs and bare-mode cache warnings would drown the report
+    set_log_level("error")
+    if args.mock:
+        server = mock_llm.serve(0, args.latency, args.token_rate, args.reply_tokens)
+        BACKENDS["Local mock"] = dict(BACKENDS["Local mock"],
+                                      base_url=f"http://127.0.0.1:{server.server_port}/v1")
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.sessions) as executor:
+        futures = [executor.submit(run_session, args.seed + i, args.runs, args.backend,
+                                   args.api_key, not args.no_cache, args.think)
+                   for i in range(args.sessions)]
+        results = [result for future in futures for result in future.result()]
+    elapsed = time.perf_counter() - start
+
+    errors = [result for result in results if isinstance(result, Exception)]
+    turns = [result for result in results if not isinstance(result, Exception)]
+    model_turns = [turn for turn in turns if turn[0]]
+    cache = response_cache().stats()
+    print(f"{args.sessions} sessions x {args.runs} run(s) on {args.backend}: "
+          f"{len(turns)} turns in {elapsed:.1f}s, {len(errors)} errors")
+    print(f"Throughput: {len(turns) / elapsed:.1f} turns/s, "
+          f"{len(model_turns) / elapsed:.1f} model turns/s")
+    print(f"All turns: {percentiles([latency for _, latency, _ in turns])}")
+    print(f"Model turns: {percentiles([latency for _, latency, _ in model_turns])}")
+    print(f"Time to first token: {percentiles([ttft for _, _, ttft in model_turns if ttft])}")
+    print(f"Answered locally: {1 - len(model_turns) / max(len(turns), 1):.0%}, "
+          f"reply cache hit rate: {cache['hit_rate']:.0%}")
+    if errors:
+        print(f"First error: {errors[0]!r}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+# Copyright (c) Streamlit Inc. (2018-2022) Snowflake Inc. (2022)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# A local stand-in for a chat-completions endpoint, the "Local mock" backend
+# of the Pizza Bot. Replies are canned but arrive like a model's: after a
+# first-token latency, then at a fixed token rate, streamed or not.
+#
+#     python mock_llm.py --port 8765 --latency 0.4 --token-rate 50
+
+import argparse
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Seconds before the first token, tokens per second after it, tokens per reply
+LATENCY = 0.4
+TOKEN_RATE = 50.0
+REPLY_TOKENS = 40
+
+FILLER = ("Thanks for ordering with us! Is there anything else you would like "
+          "to add, maybe a drink or a side of fries to go with it?").split()
+
+
+def reply_tokens(messages, n=REPLY_TOKENS):
+    """n word tokens of a canned reply to the last customer message."""
+    last = next((m["content"] for m in reversed(messages) if m["role"] == "user"), "")
+    words = f"(mock) You said: {' '.join(last.split()[:12])}.".split()
+    words += [FILLER[i % len(FILLER)] for i in range(max(n - len(words), 0))]
+    return [word if i == 0 else " " + word for i, word in enumerate(words[:n])]
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    """Serves POST /v1/chat/completions; settings are class attributes, see serve()."""
+
+    # Keep-alive, so pooled clients reuse their connections as with the real service
+    protocol_version = "HTTP/1.1"
+    latency = LATENCY
+    token_rate = TOKEN_RATE
+    reply_length = REPLY_TOKENS
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.path.rstrip("/") not in ("/v1/chat/completions", "/chat/completions"):
+            self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+            return
+        request = json.loads(body)
+        tokens = reply_tokens(request["messages"], self.reply_length)
+        base = {"id": f"chatcmpl-{uuid.uuid4().hex}", "created": int(time.time()),
+                "model": request.get("model", "mock-orderbot")}
+
+        time.sleep(self.latency)
+        if not request.get("stream"):
+            time.sleep(len(tokens) / self.token_rate)
+            prompt_tokens = sum(len(m["content"]) // 4 + 4 for m in request["messages"])
+            self._send_json(200, dict(base, object="chat.completion", choices=[{
+                "index": 0, "finish_reason": "stop",
+                "message": {"role": "assistant", "content": "".join(tokens)},
+            }], usage={"prompt_tokens": prompt_tokens, "completion_tokens": len(tokens),
+                       "total_tokens": prompt_tokens + len(tokens)}))
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        chunk = dict(base, object="chat.completion.chunk")
+        self._send_event(dict(chunk, choices=[
+            {"index": 0, "delta": {"role": "assistant", "content": ""}, "finish_reason": None}]))
+        for i, token in enumerate(tokens):
+            if i:
+                time.sleep(1 / self.token_rate)
+            self._send_event(dict(chunk, choices=[
+                {"index": 0, "delta": {"content": token}, "finish_reason": None}]))
+        self._send_event(dict(chunk, choices=[{"index": 0, "delta": {}, "finish_reason": "stop"}]))
+        self._send_chunk(b"data: [DONE]\n\n")
+        self._send_chunk(b"")
+
+    def _send_json(self, status, payload):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_event(self, payload):
+        self._send_chunk(f"data: {json.dumps(payload)}\n\n".encode())
+
+    def _send_chunk(self, data):
+        # One chunk of the chunked transfer encoding, an empty one ends the body
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+    def log_message(self, format, *args):
+        # Quiet, a load test makes thousands of requests
+        pass
+
+
+def serve(port=8765, latency=LATENCY, token_rate=TOKEN_RATE, reply_length=REPLY_TOKENS,
+          host="127.0.0.1"):
+    """Start a mock server on a daemon thread and return it; port 0 picks a free one."""
+    handler = type("Handler", (MockHandler,), dict(
+        latency=latency, token_rate=token_rate, reply_length=reply_length))
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="mock-llm", daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local mock of a chat-completions endpoint.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=LATENCY,
+                        help="seconds before the first token")
+    parser.add_argument("--token-rate", type=float, default=TOKEN_RATE,
+                        help="tokens per second after the first")
+    parser.add_argument("--reply-tokens", type=int, default=REPLY_TOKENS)
+    args = parser.parse_args()
+
+    server = serve(args.port, args.latency, args.token_rate, args.reply_tokens, args.host)
+    print(f"Mock chat completions on http://{args.host}:{server.server_port}/v1")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,191 @@
+# Copyright (c) Streamlit Inc. (2018-2022) Snowflake Inc. (2022)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Monte Carlo π kernels live here rather than in the page script so that
+# process pool workers can import them by name.
+
+import time
+from concurrent.futures import FIRST_COMPLETED, wait
+from functools import lru_cache
+from itertools import islice
+
+import numpy as np
+
+# Samplers below return n points (u, v) of the unit square; a point is a hit
+# when it lands in the quarter circle u² + v² <= 1. `start` is the position of
+# the first point in the overall run, so sequences can continue across calls.
+
+
+def uniform_points(rng, n, start=0):
+    """Plain independent uniform points."""
+    return rng.random(n), rng.random(n)
+
+
+def stratified_points(rng, n, start=0):
+    """One jittered point per cell of a k x k grid, the leftover points uniform."""
+    k = int(np.sqrt(n))
+    row, col = np.divmod(np.arange(k * k), k)
+    u = (col + rng.random(k * k)) / k
+    v = (row + rng.random(k * k)) / k
+    rest = n - k * k
+    return np.concatenate([u, rng.random(rest)]), np.concatenate([v, rng.random(rest)])
+
+
+def antithetic_points(rng, n, start=0):
+    """Uniform points paired with their mirror (1 - u, 1 - v)."""
+    half = (n + 1) // 2
+    u = rng.random(half)
+    v = rng.random(half)
+    return np.concatenate([u, 1 - u])[:n], np.concatenate([v, 1 - v])[:n]
+
+
+@lru_cache
+def _digit_table(base):
+    # Radical inverses of 0 .. base ** k - 1 for the largest such table of at
+    # most 2 ** 16 entries, built one digit per pass
+    indices = np.arange(base ** max(1, int(16 / np.log2(base))))
+    table = np.zeros(len(indices))
+    scale = 1.0 / base
+    while np.any(indices > 0):
+        indices, digit = np.divmod(indices, base)
+        table += digit * scale
+        scale /= base
+    return table
+
+
+def radical_inverse(indices, base):
+    """Van der Corput radical inverse of integer indices, a table lookup per block of digits."""
+    indices = np.array(indices, dtype=np.int64)
+    table = _digit_table(base)
+    result = np.zeros(len(indices))
+    scale = 1.0
+    while np.any(indices > 0):
+        indices, low = np.divmod(indices, len(table))
+        result += table[low] * scale
+        scale /= len(table)
+    return result
+
+
+def halton_points(rng, n, start=0):
+    """Low-discrepancy Halton sequence in bases 2 and 3 (rng unused)."""
+    indices = np.arange(start + 1, start + n + 1)
+    return radical_inverse(indices, 2), radical_inverse(indices, 3)
+
+
+SAMPLERS = {
+    "Uniform": uniform_points,
+    "Stratified grid": stratified_points,
+    "Antithetic pairs": antithetic_points,
+    "Halton sequence": halton_points,
+}
+
+# Samplers that ignore rng, the same start always gives the same points
+DETERMINISTIC_SAMPLERS = {halton_points}
+
+
+def _sequence_hits(sampler, bounds):
+    # Hits among the first b points of a deterministic sequence for every b in
+    # bounds, from one run over the sequence drawn BATCH_SIZE points at a time
+    bounds = np.unique(bounds)
+    counts = np.zeros(len(bounds), dtype=np.int64)
+    hits = 0
+    for start in range(0, int(bounds[-1]), BATCH_SIZE):
+        n = min(BATCH_SIZE, int(bounds[-1]) - start)
+        u, v = sampler(None, n, start)
+        running = hits + np.cumsum(u * u + v * v <= 1.0)
+        inside = (bounds > start) & (bounds <= start + n)
+        counts[inside] = running[bounds[inside] - start - 1]
+        hits = int(running[-1])
+    return dict(zip(bounds.tolist(), counts.tolist()))
+
+
+def error_curve(sampler, sample_sizes, repeats=16, seed=None):
+    """RMS error of the π estimate at each sample size over independent repeats.
+
+    Deterministic samplers get a fresh stretch of the sequence per repeat, all
+    read off one run of repeats * max(sample_sizes) points.
+    """
+    rng = np.random.default_rng(seed)
+    if sampler in DETERMINISTIC_SAMPLERS:
+        prefix = _sequence_hits(sampler, [r * n for n in sample_sizes for r in range(repeats + 1)])
+    errors = []
+    for n in sample_sizes:
+        squared = 0.0
+        for repeat in range(repeats):
+            if sampler in DETERMINISTIC_SAMPLERS:
+                hits = prefix[(repeat + 1) * n] - prefix[repeat * n]
+            else:
+                u, v = sampler(rng, n, repeat * n)
+                hits = np.count_nonzero(u * u + v * v <= 1.0)
+            pi_approx = 4 * hits / n
+            squared += (pi_approx - np.pi) ** 2
+        errors.append(float(np.sqrt(squared / repeats)))
+    return errors
+
+
+# Points a worker draws per batch, keeps worker memory bounded at any budget
+BATCH_SIZE = 1 << 20
+
+
+def count_hits(num_points, seed):
+    """Count uniform points of the unit square that land in the quarter circle."""
+    rng = np.random.default_rng(seed)
+    hits = 0
+    remaining = num_points
+    while remaining > 0:
+        n = min(remaining, BATCH_SIZE)
+        x = rng.random(n)
+        y = rng.random(n)
+        hits += int(np.count_nonzero(x * x + y * y <= 1.0))
+        remaining -= n
+    return hits, num_points
+
+
+def split_budget(num_samples, num_chunks):
+    """Split a sample budget into at most num_chunks near-equal non-empty chunks."""
+    base, extra = divmod(num_samples, num_chunks)
+    sizes = [base + (i < extra) for i in range(num_chunks)]
+    return [size for size in sizes if size > 0]
+
+
+def parallel_pi(num_samples, executor, num_chunks, seed=None, max_in_flight=None):
+    """Estimate π on an executor, yielding (hits, total, elapsed) as chunks finish.
+
+    At most max_in_flight chunks are submitted at a time (all of them when
+    None), so a run uses that many of a shared executor's workers.
+    """
+    sizes = split_budget(num_samples, num_chunks)
+    # One independent stream per chunk, so workers never share random numbers
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    chunks = zip(sizes, seeds)
+
+    start = time.perf_counter()
+    pending = {executor.submit(count_hits, size, s)
+               for size, s in islice(chunks, max_in_flight or len(sizes))}
+    hits = total = 0
+    try:
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            # Refill before yielding, so workers stay busy while the page draws
+            pending |= {executor.submit(count_hits, size, s)
+                        for size, s in islice(chunks, len(done))}
+            for future in done:
+                chunk_hits, chunk_total = future.result()
+                hits += chunk_hits
+                total += chunk_total
+                yield hits, total, time.perf_counter() - start
+    finally:
+        # The session may rerun mid-estimate, drop whatever has not started
+        for future in pending:
+            future.cancel()
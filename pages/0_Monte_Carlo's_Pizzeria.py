@@ -12,11 +12,18 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
 from typing import Any
+import altair as alt
 import numpy as np
+import pandas as pd
 import streamlit as st
 from streamlit.hello.utils import show_code
 
+from monte_carlo import SAMPLERS, error_curve, parallel_pi, uniform_points
+
 
 st.set_page_config(page_title="Monte Carlo's Pizza", page_icon="📹")
 st.markdown("# Monte Carlo's Pizza")
@@ -53,34 +60,71 @@ And that, my friend, is the tale of Monte Carlo's Pizza and the ingenious method
 - Fiction Author: ChatGPT"""
 )
 
-def monte_carlo_pi(num_points, width, height):
-    inside_circle = 0
-    radius = width // 2
-    center_x, center_y = width // 2, height // 2
-
-    # Initialize a white image
-    image = np.ones((height, width))
-
-    for _ in range(num_points):
-        x, y = np.random.randint(0, width), np.random.randint(0, height)
-
-        # Calculate distance from the center
-        distance = ((x - center_x) ** 2 + (y - center_y) ** 2) ** 0.5
-
-        # Check if the point is inside the circle
-        if distance <= radius:
-            inside_circle += 1
-            image[y, x] = 0  # color the point black
-
-    # Using a full circle
-    pi_approx = 4 * inside_circle / num_points
-    return pi_approx, image
+class PiEstimator:
+    """Running Monte Carlo estimate of π drawn on one persistent canvas."""
+
+    def __init__(self, width, height, rng=None, sampler=uniform_points):
+        # Pass a seeded np.random.Generator to reproduce a run
+        self.rng = rng if rng is not None else np.random.default_rng()
+        self.sampler = sampler
+        self.width, self.height = width, height
+        self.radius = width // 2
+        self.center_x, self.center_y = width // 2, height // 2
+        self.hits = 0
+        self.total = 0
+
+        # Initialize a white image, one byte per pixel
+        self.image = np.full((height, width), 255, dtype=np.uint8)
+
+    @property
+    def pi(self):
+        # Using a full circle
+        return 4 * self.hits / self.total if self.total else 0.0
+
+    def add(self, num_points):
+        # Drop only the new olives, in one batch, as offsets within a quarter
+        u, v = self.sampler(self.rng, num_points, self.total)
+
+        # Check which points are inside the circle (squared distance, no sqrt)
+        inside = u * u + v * v <= 1.0
+
+        # Fold each hit into a random quarter of the pizza to draw it
+        signs = self.rng.choice([-1, 1], size=(2, int(np.count_nonzero(inside))))
+        x = (self.center_x + signs[0] * u[inside] * self.radius).astype(int)
+        y = (self.center_y + signs[1] * v[inside] * self.radius).astype(int)
+        self.image[y, x] = 0  # color the points black
+
+        self.hits += int(np.count_nonzero(inside))
+        self.total += num_points
+        return self.pi
+
+
+def monte_carlo_pi(num_points, width, height, rng=None, sampler=uniform_points):
+    estimator = PiEstimator(width, height, rng, sampler)
+    estimator.add(num_points)
+    return estimator.pi, estimator.image / 255
+
+def render_frame(image, scale):
+    # Shrink by block-min so a block holding any olive still shows it
+    if scale > 1:
+        height, width = image.shape
+        image = image[:height - height % scale, :width - width % scale]
+        image = image.reshape(height // scale, scale, width // scale, scale).min(axis=(1, 3))
+    return image
 
 def animation_pi():
     st.title("Sofia's πzza")
 
     max_darts = st.sidebar.slider("Number of olives", 1000, 5000, 1000)
     num_trials = st.sidebar.slider("Number of trials", 0, 200, 100)
+    seed = st.sidebar.number_input("Random seed (0 = random)", min_value=0, value=0, step=1)
+    rng = np.random.default_rng(seed if seed else None)
+    strategy = st.sidebar.selectbox("Sampling strategy", list(SAMPLERS))
+
+    # Frame budget: every pushed frame is PNG-encoded and sent to the browser
+    scale = st.sidebar.select_slider("Frame downscale", options=[1, 2, 4, 8], value=2)
+    render_every = st.sidebar.slider("Render every N trials", 1, 20, 5)
+    min_frame_ms = st.sidebar.slider("Min ms between frames", 0, 1000, 100, step=50)
 
     width, height = 640, 640
 
@@ -91,10 +135,13 @@ def animation_pi():
 
     #num_trials = 100
     total_pi = 0  # Initialize a total to compute the average
+    estimator = PiEstimator(width, height, rng, SAMPLERS[strategy])
+    last_render = float("-inf")
 
     for trial_num in range(num_trials):
+        # Each trial only tops the pizza up to its olive count
         num_darts = max(1, int(max_darts * (trial_num + 1) / num_trials))
-        pi_approx, img = monte_carlo_pi(num_darts, width, height)
+        pi_approx = estimator.add(num_darts - estimator.total)
 
         total_pi += pi_approx
         average_pi = total_pi / (trial_num + 1)
@@ -103,8 +150,13 @@ def animation_pi():
         progress_bar.progress((trial_num + 1) / num_trials)  # Corrected here
         trial_text.text(f"trial {trial_num + 1}/{num_trials} - Current π ≈ {pi_approx:.4f}")
 
-        # Display the image
-        image_placeholder.image(img, use_column_width=True, clamp=True)
+        # Display the image, throttled, except that the last trial is always shown
+        now = time.perf_counter()
+        due = (trial_num + 1) % render_every == 0 and (now - last_render) * 1000 >= min_frame_ms
+        if due or trial_num + 1 == num_trials:
+            image_placeholder.image(render_frame(estimator.image, scale),
+                                    use_column_width=True, output_format="PNG")
+            last_render = now
 
 
     progress_bar.empty()
@@ -112,6 +164,70 @@ def animation_pi():
 
     st.button("Re-run")
 
+@st.cache_data
+def get_error_curves(sample_sizes, repeats, seed):
+    curves = []
+    for name, sampler in SAMPLERS.items():
+        errors = error_curve(sampler, sample_sizes, repeats=repeats, seed=seed)
+        curves.append(pd.DataFrame({"strategy": name, "samples": sample_sizes, "rms_error": errors}))
+    return pd.concat(curves, ignore_index=True)
+
+def strategy_comparison():
+    st.title("Olives per digit of π")
+    st.write("""RMS error of the π estimate against the number of olives for each
+sampling strategy. Lower curves reach the same accuracy with fewer olives.""")
+
+    sample_sizes = tuple(np.unique(np.logspace(2, 6, 9).astype(int)).tolist())
+    curves = get_error_curves(sample_sizes, repeats=16, seed=0)
+
+    chart = alt.Chart(curves).mark_line(point=True).encode(
+        x=alt.X("samples:Q", scale=alt.Scale(type="log"), title="olives"),
+        y=alt.Y("rms_error:Q", scale=alt.Scale(type="log"), title="RMS error"),
+        color="strategy:N",
+        tooltip=["strategy:N", "samples:Q", alt.Tooltip("rms_error:Q", format=".2e")]
+    )
+    st.altair_chart(chart, use_container_width=True)
+
+@st.cache_resource
+def get_executor():
+    # One pool with a process per CPU, shared by every session of this server;
+    # a run limits itself to its number of workers
+    return ProcessPoolExecutor(max_workers=os.cpu_count() or 1)
+
+def parallel_mode():
+    st.sidebar.header("Parallel mode")
+    if not st.sidebar.checkbox("Run a large parallel estimate", False):
+        return
+
+    num_samples = st.sidebar.select_slider(
+        "Number of samples", options=[10 ** k for k in range(5, 10)], value=10 ** 7,
+        format_func=lambda n: f"10^{len(str(n)) - 1}")
+    max_workers = os.cpu_count() or 1
+    workers = int(st.sidebar.number_input("Workers", 1, max_workers, max_workers))
+    seed = st.sidebar.number_input("Parallel seed (0 = random)", min_value=0, value=0, step=1)
+
+    st.title("Sofia's πzza at scale")
+    progress_bar = st.progress(0)
+    rate_text = st.empty()
+    chart_placeholder = st.empty()
+
+    samples, estimates = [], []
+    for hits, total, elapsed in parallel_pi(num_samples, get_executor(), num_chunks=workers * 8,
+                                            seed=seed if seed else None, max_in_flight=workers):
+        pi_approx = 4 * hits / total
+        samples.append(total)
+        estimates.append(pi_approx)
+
+        progress_bar.progress(total / num_samples)
+        rate_text.text(f"π ≈ {pi_approx:.6f} from {total:,} samples in {elapsed:.2f}s "
+                       f"({total / elapsed:,.0f} samples/sec on {workers} workers)")
+        chart_placeholder.line_chart({"samples": samples, "π estimate": estimates,
+                                      "π": [np.pi] * len(samples)}, x="samples")
+
+    progress_bar.empty()
+
 # Call the function
 animation_pi()
+strategy_comparison()
+parallel_mode()
 
@@ -12,212 +12,26 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import pandas as pd
-import altair as alt
 import streamlit as st
 
-# For simple pie chart with percentage
-def alt_pie(data:pd.DataFrame, value_col:str, color_by:str,
-            title_name:str=None):
-    # Add percentage
-    data['percentage'] = data[value_col]/sum(data[value_col])
-    
-    # Plot normal pie chart
-    chart = alt.Chart(data).mark_arc().encode(
-        theta=alt.Theta(field=value_col, type="quantitative"),
-        color=alt.Color(field=color_by, type="nominal", scale=alt.Scale(scheme='yellowgreenblue')),
-        tooltip=[color_by, value_col, alt.Tooltip('percentage:Q', format='.1%')]
-    ).properties(
-        width=300,
-        height=300
-    )
-    
-    # Add title
-    if title_name:
-        chart = chart.properties(
-            title={
-                "text": [title_name],
-                "fontSize": 12,
-                "fontWeight": "bold"
-            }
-        )
-    return chart.configure_view(stroke=None)
-
-# Create a bar chart of the promotion sales by region and Has_Promo using Altair
-def alt_bar_horizontal(data:pd.DataFrame, x_col:str, y_col:str, color_by:str,
-                       title_name:str=None, sort_bar=True, show_data=False, color_domain_order=None):
-    # Add percentage
-    numeric_cols = data.select_dtypes(include='number').columns
-    y_sum = data.groupby(y_col)[numeric_cols].sum(numeric_only=True)[x_col].reset_index().rename(columns={x_col:'Total'})
-    data = data.merge(y_sum, on=y_col, how='left')
-    data['percentage'] = data[x_col]/data['Total']
-
-    # Show dataframe result
-    if show_data:
-        print(data)
-        
-    if len(data[color_by].unique()) > 5:
-        my_scheme = 'category20'
-        color_scale = alt.Scale(scheme=my_scheme)
-    else:
-        my_scheme = 'yellowgreenblue'
-        color_range = ['#ffffcc', '#a1dab4', '#41b6c4', '#2c7fb8', '#253494']
-        if color_domain_order:
-            color_scale = alt.Scale(domain=color_domain_order, range=color_range)
-        else:
-            color_scale = alt.Scale(scheme=my_scheme)
-
-    # Sort the color by the color domain
-    if color_domain_order:
-        coloring = alt.Color('%s:N' % color_by,
-                legend=alt.Legend(title=color_by, orient='right'),
-                scale=color_scale,
-                sort=color_domain_order)
-    else:
-        coloring = alt.Color('%s:N' % color_by,
-                        legend=alt.Legend(title=color_by, orient='right'),
-                        scale=color_scale)
-    # Sort the axis
-    if sort_bar:
-        sort_by = '-x'
-    else:
-        sort_by = 'y'
-
-    # Plot bar chart
-    chart = alt.Chart(data).mark_bar().encode(
-        x=alt.X('%s:Q' % x_col, axis=alt.Axis(labelAngle=0, title=x_col)),
-        y=alt.Y('%s:N' % y_col, sort=sort_by),
-        color=coloring,
-        order=alt.Order('color_%s_sort_index:Q' % color_by),
-        tooltip=['%s:N' % color_by, '%s:Q' % x_col, '%s:N' % y_col,
-                  alt.Tooltip('percentage:Q', format='.1%')]
-    ).properties(
-        width=500,
-        height=400
-    )
-    # Mark percentage for boolean category
-    if data[color_by].dtype == bool:
-        data['X_Loc'] = data.apply(lambda row: row['Total'] if row[color_by] else row[x_col], axis=1)
-        data['X_Loc'] = data.loc[(data['Total'] > max(data['Total'])*0.3) | (data[color_by])]['X_Loc']
-        data['X_Loc'] = data.loc[(data[x_col] < data['Total']*0.8) | (data[color_by])]['X_Loc']
-        text_perc = chart.mark_text(
-            align='center',
-            baseline='bottom',
-            dy=5,
-            dx=20
-        ).encode(
-            y='%s:N' % y_col,
-            x=alt.X('X_Loc:Q', axis=alt.Axis(labelAngle=0)),
-            text=alt.Text('percentage:Q', format='.1%')
-        )
-
-        chart = chart + text_perc
-
-    # Add title
-    if title_name:
-        chart = chart.properties(
-            title={
-                "text": [title_name],
-                "fontSize": 12,
-                "fontWeight": "bold"
-            }
-        )
-    return chart
-
-def alt_bar_vertical(data: pd.DataFrame, x_col: str, y_col: str, color_by: str,
-                     title_name: str = None, sort_bar: bool = True, show_data: bool = False,
-                     color_domain_order: list = None):
-
-    # Add percentage
-    numeric_cols = data.select_dtypes(include='number').columns
-    y_sum = data.groupby(y_col)[numeric_cols].sum(numeric_only=True)[x_col].reset_index().rename(columns={x_col:'Total'})
-    data = data.merge(y_sum, on=y_col, how='left')
-    data['percentage'] = data[x_col]/data['Total']
-
-    # Show dataframe result
-    if show_data:
-        print(data)
-        
-    # Change color scheme for different use case
-    if len(data[color_by].unique()) > 5:
-        my_scheme = 'category20'
-        color_scale = alt.Scale(scheme=my_scheme)
-    else:
-        my_scheme = 'yellowgreenblue'
-        color_range = ['#ffffcc', '#a1dab4', '#41b6c4', '#2c7fb8', '#253494']
-        if color_domain_order:
-            color_scale = alt.Scale(domain=color_domain_order, range=color_range)
-        else:
-            color_scale = alt.Scale(scheme=my_scheme)
-
-    # Sort the color by the color domain
-    if color_domain_order:
-        coloring = alt.Color('%s:N' % color_by,
-                legend=alt.Legend(title=color_by, orient='right'),
-                scale=color_scale,
-                sort=color_domain_order)
-    else:
-        coloring = alt.Color('%s:N' % color_by,
-                        legend=alt.Legend(title=color_by, orient='right'),
-                        scale=color_scale)
-    # Sort the axis
-    if sort_bar:
-        sort_by = '-y'
-    else:
-        sort_by = 'x'
-
-    # Plot bar chart
-    chart = alt.Chart(data).mark_bar().encode(
-        y=alt.Y('%s:Q' % x_col),
-        x=alt.X('%s:N' % y_col, sort=sort_by, axis=alt.Axis(labelAngle=0, title=y_col)),
-        color=coloring,
-        order=alt.Order('color_%s_sort_index:Q' % color_by, sort='descending'),
-        tooltip=['%s:N' % color_by, '%s:Q' % x_col, '%s:N' % y_col,
-                 alt.Tooltip('percentage:Q', format='.1%')]
-    ).properties(
-        width=400,
-        height=500
-    )
-    
-    # Mark percentage for boolean category
-    if data[color_by].dtype == bool:
-        data['Y_Loc'] = data.apply(lambda row: row['Total'] if row[color_by] else row[x_col], axis=1)
-        data['Y_Loc'] = data.loc[(data['Total'] > max(data['Total']) * 0.3) | (data[color_by])]['Y_Loc']
-        data['Y_Loc'] = data.loc[(data[x_col] < data['Total'] * 0.8) | (data[color_by])]['Y_Loc']
-
-        text_perc = chart.mark_text(
-            align='center',
-            baseline='middle',
-            dy=-15
-        ).encode(
-            x='%s:N' % y_col,
-            y=alt.Y('Y_Loc:Q', axis=alt.Axis(labelAngle=0)),
-            text=alt.Text('percentage:Q', format='.1%')
-        )
-
-        chart = chart + text_perc
-
-    # Add title
-    if title_name:
-        chart = chart.properties(
-            title={
-                "text": [title_name],
-                "fontSize": 12,
-                "fontWeight": "bold"
-            }
-        )
-    return chart
+from charts import (PAYLOAD_MAX_ROWS, alt_bar_horizontal, alt_bar_vertical, alt_pie, alt_point,
+                    bin_points, chart_spec, payload_size)
+from sales_data import data_version, load_cube, load_order_count, rollup
 
 st.set_page_config(page_title="Pizzeria EDA", page_icon="📈")
 st.markdown("# Pizzeria EDA")
 st.sidebar.header("Pizzeria EDA")
+max_points = int(st.sidebar.number_input("Max points per price chart", 50, 5000, PAYLOAD_MAX_ROWS, step=50,
+                                         help="Larger price charts are binned on the server"))
+show_payload = st.sidebar.checkbox("Show chart payload size", True)
 
-# Basic Stats
-df = pd.read_csv('./pizza_sales.csv')
+# Basic Stats, every frame below is rolled up from the cached aggregation cubes
+cube = load_cube()
+sales_version = data_version()
 # Total Meta Stats
-ms_total_rev = df['total_price'].sum()
-ms_total_sales = df['quantity'].sum()
-ms_total_order = df['order_id'].nunique()
+ms_total_rev = cube['sales'].sum()
+ms_total_sales = cube['quantity'].sum()
+ms_total_order = load_order_count()
 
 # Average Meta Stats
 ms_average_rev = ms_total_rev/ms_total_order
@@ -239,89 +53,56 @@ st.write(
     """ % (ms_total_rev, ms_total_sales, ms_total_order, ms_average_rev, ms_average_sales)
 )
 
-
-
-# Pizza Sales Count (with Size)
-name_size_cnt = df.groupby(['pizza_name', 'pizza_size']).count()['order_id'].reset_index()
-name_size_cnt = name_size_cnt.rename(columns={'order_id': 'count'})
-
-name_size_p1 = alt_bar_horizontal(name_size_cnt, 'count', 'pizza_name', 'pizza_size', title_name='Pizza Order Distribution', color_domain_order=['S', 'M', 'L', 'XL', 'XXL'])
-
-# Pizza Size Sales Sum
-name_size_sum = df.groupby(['pizza_name', 'pizza_size']).sum(numeric_only=True)['total_price'].reset_index()
-name_size_sum = name_size_sum.rename(columns={'total_price': 'sales'})
-
-name_size_p2 = alt_bar_horizontal(name_size_sum, 'sales', 'pizza_name', 'pizza_size',
-                   title_name='Pizza Sales Distribution',
-                   color_domain_order=['S', 'M', 'L', 'XL', 'XXL'])
-
-# Category Sales Count (with Size)
-cate_size_cnt = df.groupby(['pizza_category', 'pizza_size']).count()['order_id'].reset_index()
-cate_size_cnt = cate_size_cnt.rename(columns={'order_id': 'count'})
-
-
-cate_size_p1 = alt_bar_vertical(cate_size_cnt, 'count', 'pizza_category', 'pizza_size',
-                   title_name='Category Order Distribution',
-                   color_domain_order=['S', 'M', 'L', 'XL', 'XXL'])
-
-# Category Sales Sum (with Size)
-cate_size_sum = df.groupby(['pizza_category', 'pizza_size']).sum(numeric_only=True)['total_price'].reset_index()
-cate_size_sum = cate_size_sum.rename(columns={'total_price': 'sales'})
-
-cate_size_p2 = alt_bar_vertical(cate_size_sum, 'sales', 'pizza_category', 'pizza_size',
-                 title_name='Category Sales Distribution',
-                 color_domain_order=['S', 'M', 'L', 'XL', 'XXL'])
-
-# Price Point Study
-price_cnt = df.groupby(['unit_price', 'pizza_size']).count()['order_id'].reset_index()
-price_cnt = price_cnt.rename(columns={'order_id': 'count'})
-
-price_p1 = alt.Chart(price_cnt).mark_point().encode(
-    x='unit_price:Q',
-    y='count:Q',
-    color='pizza_size:N',
-    tooltip=['pizza_size:N', 'unit_price:Q', 'count:Q']
-).properties(
-            title={
-                "text": ['Unit Price Distribution'],
-                "fontSize": 12,
-                "fontWeight": "bold"
-            }
-        )
-
-# Total Price Study
-total_price_cnt = df.groupby(['total_price', 'pizza_size']).count()['order_id'].reset_index()
-total_price_cnt = total_price_cnt.rename(columns={'order_id': 'count'})
-
-price_p2 = alt.Chart(total_price_cnt).mark_point().encode(
-    x='total_price:Q',
-    y='count:Q',
-    color='pizza_size:N',
-    tooltip=['pizza_size:N', 'total_price:Q', 'count:Q']
-).properties(
-            title={
-                "text": ['Order Price Distribution'],
-                "fontSize": 12,
-                "fontWeight": "bold"
-            }
-        )
-
-tab1, tab2, tab3, tab4, tab5, tab6 = st.tabs(["Pizza Order", "Pizza Sales",
-                                              "Category Order", "Category Sales",
-                                              "Unit Price", "Order Price"])
-
-with tab1:
-    st.altair_chart(name_size_p1, theme="streamlit", use_container_width=True)
-with tab2:
-    st.altair_chart(name_size_p2, theme="streamlit", use_container_width=True)
-with tab3:
-    st.altair_chart(cate_size_p1, theme="streamlit", use_container_width=True)
-with tab4:
-    st.altair_chart(cate_size_p2, theme="streamlit", use_container_width=True)
-with tab5:
-    st.altair_chart(price_p1, theme="streamlit", use_container_width=True)
-with tab6:
-    st.altair_chart(price_p2, theme="streamlit", use_container_width=True)
+SIZE_ORDER = ['S', 'M', 'L', 'XL', 'XXL']
+
+def lazy_tabs(group_key, charts):
+    # Only the open tab's chart is built; built specs are kept for the session
+    specs = st.session_state.setdefault('eda_specs', {})
+    tabs = st.tabs(list(charts), key=group_key, on_change='rerun')
+    for tab, (label, build) in zip(tabs, charts.items()):
+        if not tab.open:
+            continue
+        cache_key = (group_key, label, sales_version, max_points)
+        if cache_key not in specs:
+            # Specs embed their data, drop the ones of older data or another max_points
+            for key in [key for key in specs if key[2:] != (sales_version, max_points)]:
+                del specs[key]
+            spec = build()
+            specs[cache_key] = (spec, payload_size(spec))
+        spec, payload = specs[cache_key]
+        with tab:
+            st.vega_lite_chart(spec=spec, theme="streamlit", use_container_width=True)
+            if show_payload:
+                st.caption("Chart payload: %.1f KB" % (payload / 1024))
+
+lazy_tabs('eda_product_tabs', {
+    # Pizza Sales Count (with Size)
+    "Pizza Order": lambda: chart_spec(alt_bar_horizontal, rollup(['pizza_name', 'pizza_size'], 'count'),
+                                      'count', 'pizza_name', 'pizza_size',
+                                      title_name='Pizza Order Distribution', color_domain_order=SIZE_ORDER),
+    # Pizza Size Sales Sum
+    "Pizza Sales": lambda: chart_spec(alt_bar_horizontal, rollup(['pizza_name', 'pizza_size'], 'sales'),
+                                      'sales', 'pizza_name', 'pizza_size',
+                                      title_name='Pizza Sales Distribution', color_domain_order=SIZE_ORDER),
+    # Category Sales Count (with Size)
+    "Category Order": lambda: chart_spec(alt_bar_vertical, rollup(['pizza_category', 'pizza_size'], 'count'),
+                                         'count', 'pizza_category', 'pizza_size',
+                                         title_name='Category Order Distribution', color_domain_order=SIZE_ORDER),
+    # Category Sales Sum (with Size)
+    "Category Sales": lambda: chart_spec(alt_bar_vertical, rollup(['pizza_category', 'pizza_size'], 'sales'),
+                                         'sales', 'pizza_category', 'pizza_size',
+                                         title_name='Category Sales Distribution', color_domain_order=SIZE_ORDER),
+    # Price Point Study
+    "Unit Price": lambda: chart_spec(alt_point, bin_points(rollup(['unit_price', 'pizza_size'], 'count'),
+                                                           'unit_price', 'count', 'pizza_size', max_points),
+                                     'unit_price', 'count', 'pizza_size',
+                                     title_name='Unit Price Distribution', x_format='.2f'),
+    # Total Price Study
+    "Order Price": lambda: chart_spec(alt_point, bin_points(rollup(['total_price', 'pizza_size'], 'count'),
+                                                           'total_price', 'count', 'pizza_size', max_points),
+                                      'total_price', 'count', 'pizza_size',
+                                      title_name='Order Price Distribution', x_format='.2f'),
+})
 
 # Print out the meta stats
 st.write(
@@ -330,41 +111,20 @@ st.write(
     """ 
 )
 
-# Overall Size Sales Count
-size_cnt = df.groupby('pizza_size').count()['order_id'].reset_index()
-size_cnt = size_cnt.rename(columns={'order_id': 'count'})
-
-pie_size_p1 = alt_pie(size_cnt, 'count', 'pizza_size', title_name='Size Order Pie')
-
-# Overall Size Sales Sum
-size_sum = df.groupby('pizza_size').sum(numeric_only=True)['total_price'].reset_index()
-size_sum = size_sum.rename(columns={'total_price': 'sales'})
-
-pie_size_p2 = alt_pie(size_sum, 'sales', 'pizza_size', title_name='Size Sales Pie')
-
-# Overall Category Sales Count
-cate_cnt = df.groupby('pizza_category').count()['order_id'].reset_index()
-cate_cnt = cate_cnt.rename(columns={'order_id': 'count'})
-
-pie_cate_p1 = alt_pie(cate_cnt, 'count', 'pizza_category', title_name='Category Order Pie')
-
-# Overall Category Sales Sum
-cate_sum = df.groupby('pizza_category').sum(numeric_only=True)['total_price'].reset_index()
-cate_sum = cate_sum.rename(columns={'total_price': 'sales'})
-
-pie_cate_p2 = alt_pie(cate_sum, 'sales', 'pizza_category', title_name='Category Sales Pie')
-
-tab1, tab2, tab3, tab4 = st.tabs(["Size Order", "Size Sales",
-                                  "Category Order", "Category Sales"])
-
-with tab1:
-    st.altair_chart(pie_size_p1, theme="streamlit", use_container_width=True)
-with tab2:
-    st.altair_chart(pie_size_p2, theme="streamlit", use_container_width=True)
-with tab3:
-    st.altair_chart(pie_cate_p1, theme="streamlit", use_container_width=True)
-with tab4:
-    st.altair_chart(pie_cate_p2, theme="streamlit", use_container_width=True)
+lazy_tabs('eda_pie_tabs', {
+    # Overall Size Sales Count
+    "Size Order": lambda: chart_spec(alt_pie, rollup('pizza_size', 'count'), 'count', 'pizza_size',
+                                     title_name='Size Order Pie'),
+    # Overall Size Sales Sum
+    "Size Sales": lambda: chart_spec(alt_pie, rollup('pizza_size', 'sales'), 'sales', 'pizza_size',
+                                     title_name='Size Sales Pie'),
+    # Overall Category Sales Count
+    "Category Order": lambda: chart_spec(alt_pie, rollup('pizza_category', 'count'), 'count', 'pizza_category',
+                                         title_name='Category Order Pie'),
+    # Overall Category Sales Sum
+    "Category Sales": lambda: chart_spec(alt_pie, rollup('pizza_category', 'sales'), 'sales', 'pizza_category',
+                                         title_name='Category Sales Pie'),
+})
 
 # Print out the meta stats
 st.write(
@@ -373,46 +133,21 @@ st.write(
     """
 )
 
-# Most High Sales Season
-season_cnt = df.groupby('order_quarter').count()['order_id'].reset_index()
-season_cnt = season_cnt.rename(columns={'order_id': 'count'})
-
-season_p = alt_bar_vertical(season_cnt, 'count', 'order_quarter', 'order_quarter',
-                        title_name='Pizza Sales Season Distribution',
-                        sort_bar=False)
-
-# Most High Sales Month
-month_cnt = df.groupby('order_month').count()['order_id'].reset_index()
-month_cnt = month_cnt.rename(columns={'order_id': 'count'})
-
-month_p = alt_bar_vertical(month_cnt, 'count', 'order_month', 'order_month',
-                        title_name='Pizza Sales Month Distribution',
-                        sort_bar=False)
-
-# Most High Sales Weekday
-weekday_cnt = df.groupby('order_weekday').count()['order_id'].reset_index()
-weekday_cnt = weekday_cnt.rename(columns={'order_id': 'count'})
-
-week_p = alt_bar_vertical(weekday_cnt, 'count', 'order_weekday', 'order_weekday',
-                        title_name='Pizza Sales Weekday Distribution',
-                        sort_bar=False)
-
-# Most High Sales Hour
-hour_cnt = df.groupby('order_hour').count()['order_id'].reset_index()
-hour_cnt = hour_cnt.rename(columns={'order_id': 'count'})
-
-day_p = alt_bar_vertical(hour_cnt, 'count', 'order_hour', 'order_hour',
-                     title_name='Pizza Sales Hour Distribution',
-                     sort_bar=False)
-
-tab1, tab2, tab3, tab4 = st.tabs(["Seasonal Trend", "Monthly Trend",
-                                  "Weekly Trend", "Daily Trend"])
-
-with tab1:
-    st.altair_chart(season_p, theme="streamlit", use_container_width=True)
-with tab2:
-    st.altair_chart(month_p, theme="streamlit", use_container_width=True)
-with tab3:
-    st.altair_chart(week_p, theme="streamlit", use_container_width=True)
-with tab4:
-    st.altair_chart(day_p, theme="streamlit", use_container_width=True)
\ No newline at end of file
+lazy_tabs('eda_time_tabs', {
+    # Most High Sales Season
+    "Seasonal Trend": lambda: chart_spec(alt_bar_vertical, rollup('order_quarter', 'count'),
+                                         'count', 'order_quarter', 'order_quarter',
+                                         title_name='Pizza Sales Season Distribution', sort_bar=False),
+    # Most High Sales Month
+    "Monthly Trend": lambda: chart_spec(alt_bar_vertical, rollup('order_month', 'count'),
+                                        'count', 'order_month', 'order_month',
+                                        title_name='Pizza Sales Month Distribution', sort_bar=False),
+    # Most High Sales Weekday
+    "Weekly Trend": lambda: chart_spec(alt_bar_vertical, rollup('order_weekday', 'count'),
+                                       'count', 'order_weekday', 'order_weekday',
+                                       title_name='Pizza Sales Weekday Distribution', sort_bar=False),
+    # Most High Sales Hour
+    "Daily Trend": lambda: chart_spec(alt_bar_vertical, rollup('order_hour', 'count'),
+                                      'count', 'order_hour', 'order_hour',
+                                      title_name='Pizza Sales Hour Distribution', sort_bar=False),
+})
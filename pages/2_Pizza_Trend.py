@@ -20,6 +20,9 @@ import pandas as pd
 import streamlit as st
 from streamlit.hello.utils import show_code
 
+from trend import (MAX_POINTS, RESOLUTIONS, frame_cache, load_trend_store, pick_resolution,
+                   selection_analytics, shared_selection_frames)
+
 pizza_name_list = ['The Hawaiian Pizza',
  'The Classic Deluxe Pizza',
  'The Five Cheese Pizza',
@@ -54,43 +57,47 @@ pizza_name_list = ['The Hawaiian Pizza',
  'The Brie Carre Pizza']
 
 def pizza_data():
-    @st.cache_data
     def get_pizza_data():
-        df = pd.read_csv('./pizza_sales_time_range.csv')
-        return df
-
-    df = get_pizza_data()
+        # Derived from the order table when it is available, otherwise the
+        # shipped monthly export; cached process-wide as a TrendStore
+        return load_trend_store()
+
+    store = get_pizza_data()
+    first_day, last_day = store.periods[0].date(), store.periods[-1].date()
+    date_range = st.date_input("Date range", (first_day, last_day),
+                               min_value=first_day, max_value=last_day)
+    # The picker returns a single date while the range is being chosen
+    start, end = (date_range[0], date_range[-1]) if len(date_range) else (first_day, last_day)
+
+    resolutions = list(RESOLUTIONS)[list(RESOLUTIONS).index(store.resolution):]
+    requested = st.selectbox("Resolution", ["auto"] + resolutions)
+    resolution = pick_resolution(store, start, end, None if requested == "auto" else requested)
+    if requested not in ("auto", resolution):
+        st.caption("Showing %s points: %s would send more than %d points per pizza."
+                   % (resolution, requested, MAX_POINTS))
+    store = store.window(start, end).resample(resolution)
+    if not len(store.periods):
+        st.error("No sales in the selected date range.")
+        return
+    # Axis labels are d3 time formats, which have no quarter directive
+    date_format = {'day': '%Y-%m-%d', 'week': 'Week of %Y-%m-%d',
+                   'month': '%b %Y', 'quarter': '%b %Y'}[resolution]
     pizzas = st.multiselect(
-        "Choose pizzas", list(df['pizza_name']), ['The Classic Deluxe Pizza', 'The Five Cheese Pizza']
+        "Choose pizzas", store.names,
+        [p for p in ['The Classic Deluxe Pizza', 'The Five Cheese Pizza'] if p in store.row]
     )
     if not pizzas:
         st.error("Please select at least one pizza.")
     else:
-        data = df[df['pizza_name'].isin(pizzas)].set_index('pizza_name')
+        data, data_with_percentage, data_total = shared_selection_frames(store, pizzas)
         st.write("### Pizza Sales Selection", data)
 
-        data = data.T.reset_index()
-        data = pd.melt(data, id_vars=["index"]).rename(
-            columns={"index": "date", "value": "pizza_sales"}
-        )
-
-        # Calculate the monthly total sales for the selected pizzas
-        total_sales = data.groupby('date')['pizza_sales'].sum().reset_index()
-
-        # Merge the original data with the total sales
-        data_with_percentage = pd.merge(data, total_sales, on="date", suffixes=('', '_total'))
-
-        # Calculate the contribution percentage
-        data_with_percentage['percentage'] = (data_with_percentage['pizza_sales'] / data_with_percentage['pizza_sales_total'])
-
         # Line chart with thicker line
         line_chart = (
             alt.Chart(data_with_percentage)
             .mark_line(opacity=0.3, size=3)  # Adjust the size parameter as needed for thickness
             .encode(
-                x=alt.X("date:N", sort=['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun',
-                                        'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec'],
-                                        axis=alt.Axis(labelAngle=0)),
+                x=alt.X("date:T", title="date", axis=alt.Axis(labelAngle=0, format=date_format)),
                 y=alt.Y("pizza_sales:Q", stack=None),
                 color="pizza_name:N",
             )
@@ -101,12 +108,10 @@ def pizza_data():
             alt.Chart(data_with_percentage)
             .mark_circle(size=60, opacity=0.8)
             .encode(
-                x=alt.X("date:N", sort=['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun',
-                                        'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec'],
-                                        axis=alt.Axis(labelAngle=0)),
+                x=alt.X("date:T", title="date", axis=alt.Axis(labelAngle=0, format=date_format)),
                 y=alt.Y("pizza_sales:Q", stack=None),
                 color="pizza_name:N",
-                tooltip=["date:N", "pizza_sales:Q", "pizza_name:N", alt.Tooltip('percentage:Q', format='.1%', title='percentage')]
+                tooltip=["period:N", "pizza_sales:Q", "pizza_name:N", alt.Tooltip('percentage:Q', format='.1%', title='percentage')]
             )
         )
 
@@ -115,35 +120,21 @@ def pizza_data():
 
         st.altair_chart(chart1, use_container_width=True)
 
-        # Calculate the monthly total sales for the selected pizzas
-        data_total = data.groupby('date')['pizza_sales'].sum().reset_index()
-        data_total['pizza_name'] = 'Total'
-
-        data_total_piv = data_total
-        # Define month order
-        months_order = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
+        # Period totals of the selection as a single 'Total' row
+        data_total_piv = pd.DataFrame([data_total['pizza_sales'].to_numpy()],
+                                      index=pd.Index(['Total'], name='pizza_name'),
+                                      columns=pd.Index(data_total['period'], name='date'))
 
-        # Convert 'date' to categorical with the month order
-        data_total_piv['date'] = pd.Categorical(data_total_piv['date'], categories=months_order, ordered=True)
-
-        # Sort by 'date'
-        data_total_piv = data_total_piv.sort_values('date')
-
-        # Pivot table
-        data_total_piv = data_total_piv.pivot(index='date', columns='pizza_name', values='pizza_sales')
-
-        st.write("### Pizza Sales Total", data_total_piv.T)
+        st.write("### Pizza Sales Total", data_total_piv)
 
         # Line chart for total sales
         line_chart_total = (
             alt.Chart(data_total)
             .mark_line(opacity=0.7, size=4, color="black")  # Adjust the size parameter as needed for thickness
             .encode(
-                x=alt.X("date:N", sort=['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun',
-                                        'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec'],
-                                        axis=alt.Axis(labelAngle=0)),
+                x=alt.X("date:T", title="date", axis=alt.Axis(labelAngle=0, format=date_format)),
                 y=alt.Y("pizza_sales:Q"),
-                tooltip=["date:N", "pizza_sales:Q", "pizza_name:N"]
+                tooltip=["period:N", "pizza_sales:Q", "pizza_name:N"]
             )
         )
 
@@ -152,11 +143,9 @@ def pizza_data():
             alt.Chart(data_total)
             .mark_circle(size=70, opacity=0.8, color="black")
             .encode(
-                x=alt.X("date:N", sort=['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun',
-                                        'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec'],
-                                        axis=alt.Axis(labelAngle=0)),
+                x=alt.X("date:T", title="date", axis=alt.Axis(labelAngle=0, format=date_format)),
                 y=alt.Y("pizza_sales:Q"),
-                tooltip=["date:N", "pizza_sales:Q", "pizza_name:N"]
+                tooltip=["period:N", "pizza_sales:Q", "pizza_name:N"]
             )
         )
 
@@ -165,14 +154,63 @@ def pizza_data():
 
         st.altair_chart(chart2, use_container_width=True)
 
+        # Rolling analytics, computed for the whole catalog in one pass
+        st.write("### Pizza Trend Analytics")
+        window = st.slider("Rolling window (periods)", 2, 12, 3)
+        z_threshold = st.slider("Anomaly threshold (|z-score|)", 1.0, 4.0, 2.0, step=0.5)
+        analytics = selection_analytics(store, tuple(pizzas), window, z_threshold)
+
+        # Moving average with the anomalous periods marked
+        moving_chart = (
+            alt.Chart(analytics)
+            .mark_line(size=3)
+            .encode(
+                x=alt.X("date:T", title="date", axis=alt.Axis(labelAngle=0, format=date_format)),
+                y=alt.Y("moving_average:Q", title="moving average"),
+                color="pizza_name:N",
+            )
+        )
+        anomaly_chart = (
+            alt.Chart(analytics[analytics['anomaly']])
+            .mark_point(size=120, shape="diamond", filled=True, color="red")
+            .encode(
+                x=alt.X("date:T"),
+                y=alt.Y("pizza_sales:Q"),
+                tooltip=["period:N", "pizza_name:N", "pizza_sales:Q",
+                         alt.Tooltip("zscore:Q", format=".2f")]
+            )
+        )
+        st.altair_chart(moving_chart + anomaly_chart, use_container_width=True)
+
+        # Rank among all pizzas, best seller on top
+        rank_chart = (
+            alt.Chart(analytics)
+            .mark_line(point=True)
+            .encode(
+                x=alt.X("date:T", title="date", axis=alt.Axis(labelAngle=0, format=date_format)),
+                y=alt.Y("rank:Q", scale=alt.Scale(reverse=True, zero=False)),
+                color="pizza_name:N",
+                tooltip=["period:N", "pizza_name:N", "rank:Q",
+                         alt.Tooltip("growth:Q", format="+.1%", title="growth")]
+            )
+        )
+        st.altair_chart(rank_chart, use_container_width=True)
+
+        # Latest period of every selected pizza
+        latest = analytics[analytics['date'] == analytics['date'].max()]
+        st.write("### Latest Period", latest.set_index('pizza_name')[
+            ['period', 'pizza_sales', 'moving_average', 'growth', 'zscore', 'anomaly', 'rank']])
+
 st.set_page_config(page_title="Pizza Trend", page_icon="🍕")
 st.markdown("# Pizza Trend")
 st.sidebar.header("Pizza Trend")
 st.write(
-    """This interactive plot shows the monthly sales of Monte Carlo's Pizzeria."""
+    """This interactive plot shows the sales of Monte Carlo's Pizzeria over time."""
 )
 
 pizza_data()
 
-
-
+if st.sidebar.checkbox("Show cache stats"):
+    stats = frame_cache().stats()
+    st.sidebar.metric("Trend frame hit rate", "%.0f%%" % (100 * stats['hit_rate']))
+    st.sidebar.write(stats)
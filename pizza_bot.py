@@ -0,0 +1,391 @@
+# Copyright (c) Streamlit Inc. (2018-2022) Snowflake Inc. (2022)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Chat completion plumbing of the Pizza Bot page: clients shared by every
+# session of the server, a background path that produces a reply off the
+# script thread while the page polls it, the token-budgeted window of the
+# history that is actually sent, and a cache of replies to repeated requests.
+
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import httpx
+import openai
+import streamlit as st
+from streamlit.logger import get_logger
+
+from pizza_menu import find_items, menu_prompt
+
+LOGGER = get_logger(__name__)
+
+# Chat-completions endpoints the bot can talk to: base URL (None for OpenAI's),
+# model, and whether an API key is needed. Any server speaking the protocol
+# plugs in with an entry here; "Local mock" is the stand-in of mock_llm.py
+BACKENDS = {
+    "OpenAI": dict(base_url=None, model="gpt-3.5-turbo", needs_key=True),
+    "Local mock": dict(base_url=os.environ.get("PIZZA_BOT_MOCK_URL", "http://127.0.0.1:8765/v1"),
+                       model="mock-orderbot", needs_key=False),
+}
+
+DEFAULT_BACKEND = "OpenAI"
+
+# Sampling parameters of every OrderBot completion, the model comes from the backend
+COMPLETION_PARAMS = dict(
+    temperature=0,
+    top_p=1,
+    frequency_penalty=0,
+    presence_penalty=0,
+)
+
+# Estimated tokens a request may carry: the system prompt, a summary of the
+# older turns and as many of the latest turns as fit
+CONTEXT_BUDGET = 1500
+
+# Latest messages always sent verbatim, whatever the budget
+MIN_RECENT_MESSAGES = 2
+
+# Characters of the bot's last priced summary carried into the order state
+SUMMARY_CHARS = 600
+
+# Replies kept in memory, and seconds a cached reply stays valid
+RESPONSE_CACHE_SIZE = 1024
+RESPONSE_CACHE_TTL = 24 * 3600
+
+# SQLite file that keeps cached replies across restarts, memory only when unset
+RESPONSE_CACHE_PATH = os.environ.get("PIZZA_BOT_CACHE_DB")
+
+# Only windows with at most this many customer turns are cached: openings repeat
+# across sessions, later turns carry addresses and payment details and do not
+CACHE_MAX_CUSTOMER_TURNS = 2
+
+# Keep-alive pool of each client, connections are reused across turns and sessions
+POOL_LIMITS = httpx.Limits(max_connections=64, max_keepalive_connections=16,
+                           keepalive_expiry=60)
+
+
+# Instructions of OrderBot, shared by the page and the load generator
+SYSTEM_PROMPT = f"""
+    You are OrderBot, designed specifically to assist customers in placing their pizza orders.
+    Your interactions should be based on the following:
+    1. Greet the customer with warmth and friendliness.
+    2. Show all prices with the \\$ prefix. It's essential to always display dollar amounts this way.
+    3. Guided Order Collection: Present the menu and collect their order. Only items on the menu are available.
+    4. Once the order is collected, provide a summary. Ask if they'd like to add anything more.
+    5. Determine if the order is for pickup or delivery. If for delivery, collect the address.
+    6. Collect payment details.
+    7. Show a final summary of the customer's order.
+    8. Maintain a short, friendly, and clear conversational style throughout.
+    9. Be detailed: clarify all options, extras, and sizes to uniquely identify items from the menu.
+    10. Be careful: don't allow the customer to order items that are not on the menu!
+                    
+    Store Location: 123 Main Street, Anytown, USA.
+
+    Menu:
+
+{menu_prompt()}
+
+    """
+
+
+def completion_params(backend):
+    """COMPLETION_PARAMS with the model of a backend."""
+    return dict(COMPLETION_PARAMS, model=BACKENDS[backend]["model"])
+
+
+@st.cache_resource(max_entries=32, show_spinner=False)
+def get_client(api_key, backend=DEFAULT_BACKEND):
+    """Process-wide client of an API key and backend over a pooled keep-alive connection."""
+    # A keyless backend still needs some key for the client to send
+    return openai.OpenAI(api_key=api_key or "unused", base_url=BACKENDS[backend]["base_url"],
+                         http_client=httpx.Client(limits=POOL_LIMITS))
+
+
+@st.cache_resource(show_spinner=False)
+def _event_loop():
+    # One loop on a daemon thread runs every background completion of the process
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, name="pizza-bot-loop", daemon=True).start()
+    return loop
+
+
+@st.cache_resource(max_entries=32, show_spinner=False)
+def get_async_client(api_key, backend=DEFAULT_BACKEND):
+    """Process-wide async client of an API key and backend, used on the background loop only."""
+    return openai.AsyncOpenAI(api_key=api_key or "unused", base_url=BACKENDS[backend]["base_url"],
+                              http_client=httpx.AsyncClient(limits=POOL_LIMITS))
+
+
+class ResponseCache:
+    """Thread-safe LRU of replies with a TTL, optionally backed by SQLite, with hit/miss counters.
+
+    Only valid for deterministic completions (temperature 0): a request
+    always gets the reply first stored for it.
+    """
+
+    def __init__(self, max_entries=RESPONSE_CACHE_SIZE, ttl=RESPONSE_CACHE_TTL, path=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+        self.evictions = 0
+        self.expired = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS responses "
+                             "(key TEXT PRIMARY KEY, reply TEXT, stored_at REAL)")
+            self._db.execute("DELETE FROM responses WHERE stored_at < ?", (time.time() - ttl,))
+            self._db.commit()
+
+    @staticmethod
+    def key(messages, params):
+        """Hash of a request, insensitive to whitespace and to the case of customer turns."""
+        normalized = [
+            (m["role"], " ".join(m["content"].split()).casefold() if m["role"] == "user"
+             else " ".join(m["content"].split()))
+            for m in messages
+        ]
+        payload = json.dumps([normalized, params], sort_keys=True)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def get(self, key):
+        """Cached reply of key, or None."""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry[1] > self.ttl:
+                del self._entries[key]
+                self.expired += 1
+                entry = None
+            if entry is None and self._db is not None:
+                row = self._db.execute("SELECT reply, stored_at FROM responses WHERE key = ?",
+                                       (key,)).fetchone()
+                if row is not None and now - row[1] <= self.ttl:
+                    entry = row
+                    self.disk_hits += 1
+                    self._store(key, entry)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key, reply):
+        entry = (reply, time.time())
+        with self._lock:
+            self._store(key, entry)
+            if self._db is not None:
+                self._db.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?)",
+                                 (key, *entry))
+                self._db.commit()
+
+    def _store(self, key, entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'disk_hits': self.disk_hits,
+            'entries': len(self._entries),
+            'evictions': self.evictions,
+            'expired': self.expired,
+        }
+
+
+def cacheable(messages):
+    """Whether a window is an early one worth caching: no folded summary, few customer turns."""
+    system_messages = sum(m["role"] == "system" for m in messages)
+    customer_turns = sum(m["role"] == "user" for m in messages)
+    return system_messages == 1 and customer_turns <= CACHE_MAX_CUSTOMER_TURNS
+
+
+@st.cache_resource
+def response_cache():
+    """The ResponseCache shared by every session of this server process."""
+    return ResponseCache(path=RESPONSE_CACHE_PATH)
+
+
+def stream_tokens(chunks, start, key=None):
+    """Yield the text of streamed completion chunks, logging time to first token.
+
+    With a key, the whole reply is cached once the stream completes.
+    """
+    first_token = True
+    tokens = []
+    for chunk in chunks:
+        token = chunk.choices[0].delta.content if chunk.choices else None
+        if not token:
+            continue
+        if first_token:
+            first_token = False
+            LOGGER.info("Pizza Bot time to first token: %.3fs", time.perf_counter() - start)
+        tokens.append(token)
+        yield token
+    LOGGER.info("Pizza Bot reply time: %.3fs", time.perf_counter() - start)
+    if key is not None:
+        response_cache().put(key, "".join(tokens))
+
+
+def complete(api_key, messages, stream=True, backend=DEFAULT_BACKEND, use_cache=True):
+    """Run a completion on the calling thread: a token iterator, or the reply text."""
+    params = completion_params(backend)
+    use_cache = use_cache and cacheable(messages)
+    key = ResponseCache.key(messages, params) if use_cache else None
+    cached = response_cache().get(key) if use_cache else None
+    if cached is not None:
+        LOGGER.info("Pizza Bot reply served from cache")
+        return iter([cached]) if stream else cached
+
+    start = time.perf_counter()
+    response = get_client(api_key, backend).chat.completions.create(
+        messages=messages, stream=stream, **params)
+    if stream:
+        return stream_tokens(response, start, key)
+    LOGGER.info("Pizza Bot reply time: %.3fs", time.perf_counter() - start)
+    reply = response.choices[0].message.content
+    if use_cache:
+        response_cache().put(key, reply)
+    return reply
+
+
+class PendingReply:
+    """A reply being streamed in the background.
+
+    text grows as tokens arrive; done is set once the completion ends, with
+    error holding the exception if it failed.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self.done = False
+        self.error = None
+        self.future = None
+
+
+async def _stream_reply(client, messages, params, reply, key, cache):
+    start = time.perf_counter()
+    try:
+        stream = await client.chat.completions.create(
+            messages=messages, stream=True, **params)
+        async for chunk in stream:
+            token = chunk.choices[0].delta.content if chunk.choices else None
+            if not token:
+                continue
+            if not reply.text:
+                LOGGER.info("Pizza Bot time to first token: %.3fs",
+                            time.perf_counter() - start)
+            reply.text += token
+        LOGGER.info("Pizza Bot reply time: %.3fs", time.perf_counter() - start)
+        if key is not None:
+            cache.put(key, reply.text)
+    except Exception as error:
+        reply.error = error
+    finally:
+        reply.done = True
+
+
+def submit_reply(api_key, messages, backend=DEFAULT_BACKEND):
+    """Start a completion on the background loop and return its PendingReply."""
+    reply = PendingReply()
+    params = completion_params(backend)
+    key = ResponseCache.key(messages, params) if cacheable(messages) else None
+    cached = response_cache().get(key) if key is not None else None
+    if cached is not None:
+        LOGGER.info("Pizza Bot reply served from cache")
+        reply.text = cached
+        reply.done = True
+        return reply
+    # Copy the history, the session keeps appending to its own list
+    coroutine = _stream_reply(get_async_client(api_key, backend), list(messages), params,
+                              reply, key, response_cache())
+    reply.future = asyncio.run_coroutine_threadsafe(coroutine, _event_loop())
+    return reply
+
+
+def count_tokens(message):
+    """Estimated tokens of a chat message, about 4 characters per token."""
+    # A few tokens of framing per message on top of its text
+    return len(message["content"]) // 4 + 4
+
+
+def order_state(turns):
+    """Compact summary of older turns: items mentioned, fulfilment, last total."""
+    customer = " ".join(m["content"] for m in turns if m["role"] == "user").lower()
+    items = list(dict.fromkeys(item for _, _, item in find_items(customer)))
+    if "deliver" in customer:
+        fulfilment = "delivery"
+    elif "pick" in customer:
+        fulfilment = "pickup"
+    else:
+        fulfilment = "not decided"
+    totals = [m["content"] for m in turns
+              if m["role"] == "assistant" and "$" in m["content"]]
+    lines = [
+        "Summary of the earlier conversation:",
+        f"- Items the customer mentioned: {', '.join(items) or 'none'}",
+        f"- Pickup or delivery: {fulfilment}",
+    ]
+    if totals:
+        # The bot's own latest priced summary carries sizes and extras
+        last = " ".join(totals[-1].split())[:SUMMARY_CHARS]
+        lines.append(f"- Last order summary you gave: {last}")
+    return "\n".join(lines)
+
+
+def context_window(messages, budget=CONTEXT_BUDGET):
+    """Messages to send: the system prompt, the older turns folded, the latest verbatim.
+
+    messages[0] is the system prompt. Latest turns are kept while they fit the
+    budget; the rest are replaced with a single order_state system message.
+    """
+    system, turns = messages[0], messages[1:]
+    remaining = budget - count_tokens(system)
+    kept = 0
+    for message in reversed(turns):
+        cost = count_tokens(message)
+        if kept >= MIN_RECENT_MESSAGES and cost > remaining:
+            break
+        remaining -= cost
+        kept += 1
+    folded, recent = turns[:len(turns) - kept], turns[len(turns) - kept:]
+    if folded:
+        summary = {"role": "system", "content": order_state(folded)}
+        # The summary must fit too, drop the oldest kept turns until it does
+        while len(recent) > MIN_RECENT_MESSAGES and count_tokens(summary) > remaining:
+            remaining += count_tokens(recent[0])
+            folded, recent = folded + recent[:1], recent[1:]
+            summary = {"role": "system", "content": order_state(folded)}
+        window = [system, summary] + recent
+    else:
+        window = [system] + recent
+    LOGGER.info("Pizza Bot sending ~%d tokens: %d messages, %d older folded",
+                sum(count_tokens(m) for m in window), len(window), len(folded))
+    return window
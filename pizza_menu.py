@@ -0,0 +1,299 @@
+# Copyright (c) Streamlit Inc. (2018-2022) Snowflake Inc. (2022)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# The OrderBot menu as data, and a deterministic parser that answers the
+# common turns (orders like "2 large pepperoni with mushrooms", price
+# questions, running totals) without a model round-trip. Anything it does
+# not fully understand is left to the model.
+
+import re
+
+# Price of every item per size, by category; the page tables and the system
+# prompt are both rendered from this
+MENU = {
+    "Pizzas": {
+        "Pepperoni Pizza": {"Large": 12.95, "Med.": 10.00, "Small": 7.00},
+        "Cheese Pizza": {"Large": 10.95, "Med.": 9.25, "Small": 6.50},
+        "Eggplant Pizza": {"Large": 11.95, "Med.": 9.75, "Small": 6.75},
+    },
+    "Sides": {
+        "Fries": {"Reg.": 4.50, "Small": 3.50},
+        "Greek Salad": {"Reg.": 7.25},
+    },
+    "Toppings": {
+        "Extra Cheese": {"Reg.": 2.00},
+        "Mushrooms": {"Reg.": 1.50},
+        "Sausage": {"Reg.": 3.00},
+        "Canadian Bacon": {"Reg.": 3.50},
+        "AI Sauce": {"Reg.": 1.50},
+        "Peppers": {"Reg.": 1.00},
+    },
+    "Drinks": {
+        "Coke": {"Large": 3.00, "Med.": 2.00, "Small": 1.00},
+        "Sprite": {"Large": 3.00, "Med.": 2.00, "Small": 1.00},
+        "Bottled Water": {"Large": 5.00},
+    },
+}
+
+# item -> {size: price} and item -> category, the in-memory index of MENU
+PRICES = {item: sizes for items in MENU.values() for item, sizes in items.items()}
+CATEGORIES = {item: category for category, items in MENU.items() for item in items}
+
+# Words customers use for each item, besides its full name
+ITEM_ALIASES = {
+    "Pepperoni Pizza": ["pepperoni"],
+    "Cheese Pizza": ["cheese"],
+    "Eggplant Pizza": ["eggplant"],
+    "Greek Salad": ["salad"],
+    "Mushrooms": ["mushroom"],
+    "Canadian Bacon": ["bacon"],
+    "Peppers": ["pepper"],
+    "Bottled Water": ["water"],
+}
+
+SIZE_WORDS = {
+    "large": "Large", "big": "Large", "lg": "Large",
+    "medium": "Med.", "med": "Med.",
+    "small": "Small",
+    "regular": "Reg.", "reg": "Reg.",
+}
+
+NUMBER_WORDS = {
+    "a": 1, "an": 1, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5,
+    "six": 6, "seven": 7, "eight": 8, "nine": 9, "ten": 10,
+}
+
+# Words an order turn may contain besides items, sizes and quantities
+ORDER_WORDS = {
+    "i", "i'd", "id", "i'll", "ill", "we", "we'd", "we'll", "would", "like", "want",
+    "please", "can", "could", "may", "get", "have", "take", "add", "give", "me", "us",
+    "and", "with", "of", "also", "plus", "some", "pizza", "pizzas", "another", "more",
+    "order", "to", "my", "on", "it", "them", "too", "as", "well", "thanks", "thank", "you",
+    "yes", "ok", "okay", "sure", "size", "extra", "the",
+}
+
+PRICE_QUESTION = re.compile(r"\b(how much|price|prices|cost|costs)\b")
+TOTAL_QUESTION = re.compile(r"\b(total|my order|so far)\b")
+
+# Words of a free-form turn that may change the order behind the parser's back
+CHANGE_WORDS = re.compile(r"\b(remove|cancel|change|instead|without|replace|no more|delete)\b")
+
+
+def _item_pattern():
+    # Longest names first, so "extra cheese" wins over "cheese" and "pepperoni" over "pepper"
+    names = {item.lower(): item for item in PRICES}
+    for item, aliases in ITEM_ALIASES.items():
+        names.update((alias, item) for alias in aliases)
+    alternation = "|".join(re.escape(name) for name in sorted(names, key=len, reverse=True))
+    return re.compile(rf"\b({alternation})(?:e?s)?\b"), names
+
+
+ITEM_PATTERN, ITEM_NAMES = _item_pattern()
+
+
+def find_items(text):
+    """Menu items named in a text, as (start, end, item) in order of appearance."""
+    return [(m.start(), m.end(), ITEM_NAMES[m.group(1)])
+            for m in ITEM_PATTERN.finditer(text.lower())]
+
+
+def dollars(amount):
+    # Escaped so Streamlit Markdown does not read a pair of prices as LaTeX
+    return f"\\${amount:.2f}"
+
+
+def price_list(item):
+    """Prices of an item, e.g. "\\$3.00 (Large), \\$2.00 (Med.)", no size for single-size items."""
+    sizes = PRICES[item]
+    if len(sizes) == 1:
+        return dollars(next(iter(sizes.values())))
+    return ", ".join(f"{dollars(price)} ({size})" for size, price in sizes.items())
+
+
+def menu_markdown():
+    """The menu as one Markdown table per category, a column per size."""
+    sections = []
+    for category, items in MENU.items():
+        sizes = list(dict.fromkeys(size for prices in items.values() for size in prices))
+        rows = [f"#### {category}", "",
+                "| Item | " + " | ".join(sizes) + " |",
+                "|---" * (len(sizes) + 1) + "|"]
+        for item, prices in items.items():
+            cells = [f"{prices[size]:.2f}" if size in prices else "" for size in sizes]
+            rows.append(f"| {item} | " + " | ".join(cells) + " |")
+        sections.append("\n".join(rows))
+    return "\n\n".join(sections)
+
+
+def menu_prompt():
+    """The menu as the indented list the system prompt embeds."""
+    lines = []
+    for category, items in MENU.items():
+        lines.append(f"    {category}:")
+        lines.extend(f"        - {item}: {price_list(item)}" for item in items)
+    return "\n".join(lines)
+
+
+class OrderLine:
+    """quantity x item in a size, pizzas possibly with toppings."""
+
+    def __init__(self, item, size=None, quantity=1, toppings=None):
+        self.item = item
+        self.size = size
+        self.quantity = quantity
+        self.toppings = toppings or []
+
+    @property
+    def price(self):
+        each = PRICES[self.item][self.size]
+        each += sum(PRICES[topping]["Reg."] for topping in self.toppings)
+        return self.quantity * each
+
+    def __str__(self):
+        size = f"{self.size} " if len(PRICES[self.item]) > 1 else ""
+        toppings = f" with {', '.join(self.toppings)}" if self.toppings else ""
+        return f"{self.quantity} x {size}{self.item}{toppings} ({dollars(self.price)})"
+
+
+class Order:
+    """The running order of a session as far as the local parser has seen it.
+
+    pending holds lines waiting for the customer to pick a size. synced turns
+    False once a turn the model handled may have taken or changed an order,
+    from then on totals are left to the model too.
+    """
+
+    def __init__(self):
+        self.lines = []
+        self.pending = []
+        self.synced = True
+
+    @property
+    def total(self):
+        return sum(line.price for line in self.lines)
+
+    def summary(self):
+        if not self.lines:
+            return "Your order is empty so far."
+        lines = "\n".join(f"- {line}" for line in self.lines)
+        return f"Your order so far:\n{lines}\n\nTotal: {dollars(self.total)}"
+
+
+def _words(text):
+    return re.findall(r"[a-z0-9']+", text)
+
+
+def parse_order(text):
+    """Order lines of a turn made only of quantities, sizes and items, else None.
+
+    Sizes are None where the customer did not give a valid one. Toppings go
+    on the pizza before them; a bare "cheese" among them, as in "with
+    mushrooms and cheese", is Extra Cheese.
+    """
+    text = text.lower()
+    matches = find_items(text)
+    if not matches:
+        return None
+    # Every word outside the item names must be one the parser understands
+    rest = ITEM_PATTERN.sub(" ", text)
+    if any(word not in ORDER_WORDS and word not in SIZE_WORDS and word not in NUMBER_WORDS
+           and not word.isdigit() for word in _words(rest)):
+        return None
+
+    lines = []
+    previous_end = 0
+    toppings = False
+    for start, end, item in matches:
+        segment = _words(text[previous_end:start])
+        previous_end = end
+        on_pizza = bool(lines) and CATEGORIES[lines[-1].item] == "Pizzas"
+        if (item == "Cheese Pizza" and on_pizza and ("with" in segment or toppings)
+                and not text[start:end].startswith("cheese pizza")):
+            if any(word in SIZE_WORDS or word.isdigit() or NUMBER_WORDS.get(word, 1) > 1
+                   for word in segment):
+                # "with two large cheese", a second pizza or a topping, ask the model
+                return None
+            item = "Extra Cheese"
+        if CATEGORIES[item] == "Toppings" and on_pizza:
+            lines[-1].toppings.append(item)
+            toppings = True
+            continue
+        toppings = False
+        quantity = 1
+        size = None
+        for word in segment:
+            if word.isdigit():
+                quantity = int(word)
+            elif word in NUMBER_WORDS:
+                quantity = NUMBER_WORDS[word]
+            elif word in SIZE_WORDS:
+                size = SIZE_WORDS[word]
+        sizes = PRICES[item]
+        if len(sizes) == 1:
+            size = next(iter(sizes))
+        elif size not in sizes:
+            size = None
+        lines.append(OrderLine(item, size, quantity))
+    return lines
+
+
+def _answer_order(lines, order):
+    order.lines.extend(line for line in lines if line.size)
+    order.pending = [line for line in lines if not line.size]
+    added = "\n".join(f"- {line}" for line in lines if line.size)
+    reply = f"Added:\n{added}" if added else ""
+    if added and order.synced:
+        # Out of sync, order.lines may still hold items the model took off
+        reply += f"\n\nTotal so far: {dollars(order.total)}."
+    if order.pending:
+        line = order.pending[0]
+        question = (f"What size would you like for the {line.item}? "
+                    f"It is {price_list(line.item)}.")
+        return f"{reply}\n\n{question}" if reply else question
+    return f"{reply}\n\nWould you like anything else?"
+
+
+def local_reply(text, order):
+    """Answer a turn from the menu and the running order, or None to ask the model."""
+    lowered = text.lower()
+    words = _words(lowered)
+
+    # A bare size answers the size question of the pending lines
+    sizes = [SIZE_WORDS[word] for word in words if word in SIZE_WORDS]
+    if order.pending and len(sizes) == 1 and not find_items(lowered) and all(
+            word in SIZE_WORDS or word in ORDER_WORDS for word in words):
+        lines, order.pending = order.pending, []
+        for line in lines:
+            if sizes[0] in PRICES[line.item]:
+                line.size = sizes[0]
+        return _answer_order(lines, order)
+
+    if PRICE_QUESTION.search(lowered) or TOTAL_QUESTION.search(lowered):
+        items = list(dict.fromkeys(item for _, _, item in find_items(lowered)))
+        total = TOTAL_QUESTION.search(lowered)
+        if items and not total:
+            return "\n".join(f"- {item}: {price_list(item)}" for item in items)
+        if total and not items and order.synced:
+            return order.summary()
+        # Prices of the menu in general, or of things not on it, are for the model
+    else:
+        lines = parse_order(lowered)
+        if lines is not None:
+            return _answer_order(lines, order)
+
+    # Left to the model, which may take or change orders in ways the parser
+    # cannot follow, even while order.lines is still empty
+    if find_items(lowered) or CHANGE_WORDS.search(lowered):
+        order.synced = False
+    return None
@@ -0,0 +1,586 @@
+# Copyright (c) Streamlit Inc. (2018-2022) Snowflake Inc. (2022)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Shared, typed access to the pizzeria sales data used by the pages.
+
+import base64
+import csv
+import io
+import itertools
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+import streamlit as st
+
+SALES_PATH = './pizza_sales.csv'
+TIME_RANGE_PATH = './pizza_sales_time_range.csv'
+
+# Explicit schema, so the order table is never re-inferred from text
+SALES_DTYPES = {
+    'order_id': 'int32',
+    'pizza_id': 'int32',
+    'quantity': 'int16',
+    'unit_price': 'float32',
+    'total_price': 'float32',
+    'pizza_name_id': 'category',
+    'pizza_name': 'category',
+    'pizza_size': 'category',
+    'pizza_category': 'category',
+    'pizza_ingredients': 'category',
+    'order_hour': 'int8',
+    'order_month': 'int8',
+}
+
+
+def columnar_path(csv_path):
+    """Path of the Feather copy kept next to a CSV."""
+    return os.path.splitext(csv_path)[0] + '.feather'
+
+
+def persist_columnar(path, source_path, build):
+    """Write build()'s frame to Feather at path unless it is newer than source_path."""
+    if os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(source_path):
+        return path
+
+    df = build()
+    # Uncompressed so it can be memory-mapped; written aside and swapped in
+    # so other worker processes never see a half-written file
+    tmp_path = '%s.%d.tmp' % (path, os.getpid())
+    df.to_feather(tmp_path, compression='uncompressed')
+    os.replace(tmp_path, path)
+    return path
+
+
+def read_columnar(path, source_path, build, memory_map=True):
+    """Frame of build(), persisted as Feather and rebuilt whenever source_path is newer.
+
+    With memory_map the columns are backed by the OS page cache, which is
+    shared by every process reading the same file.
+    """
+    try:
+        path = persist_columnar(path, source_path, build)
+    except OSError:
+        # Read-only data directory, build it in memory as before
+        return build()
+    table = feather.read_table(path, memory_map=memory_map)
+    return table.to_pandas(split_blocks=True)
+
+
+def read_typed(csv_path, dtypes=None, memory_map=True):
+    """Read a CSV through its Feather copy, rebuilt whenever the CSV is newer."""
+    return read_columnar(columnar_path(csv_path), csv_path,
+                         lambda: pd.read_csv(csv_path, dtype=dtypes), memory_map)
+
+
+def data_version(path=SALES_PATH):
+    """Version stamp of a data file, changes whenever the file is rewritten."""
+    return os.path.getmtime(path)
+
+
+@st.cache_resource(max_entries=2)
+def _read_time_range(path, mtime):
+    # mtime is only part of the cache key, a rewritten file gets a new entry
+    return read_typed(path)
+
+
+def load_time_range(path=TIME_RANGE_PATH):
+    """Pizza by month revenue matrix of the Trend page, parsed once per server process and file version.
+
+    The frame is shared by every session, so callers must not modify it.
+    """
+    return _read_time_range(path, os.path.getmtime(path))
+
+
+# Trend granularities: pandas period frequency and period column label
+TREND_GRAINS = {
+    'month': ('M', '%Y-%m'),
+    'week': ('W', '%Y-%m-%d'),
+    'day': ('D', '%Y-%m-%d'),
+    'hour': ('h', '%Y-%m-%d %H:00'),
+}
+
+
+def order_timestamps(df):
+    """Timestamp of every order line, from its order_date and order_time."""
+    return pd.to_datetime(df['order_date'].astype(str) + ' ' + df['order_time'].astype(str))
+
+
+def hourly_revenue(df):
+    """Revenue per pizza_name and hour, the finest trend grain, summed in float64."""
+    # Widen first, float32 sums drift by cents over a few thousand lines
+    hourly = pd.DataFrame({'pizza_name': df['pizza_name'],
+                           'hour': order_timestamps(df).dt.floor('h'),
+                           'total_price': df['total_price'].astype('float64')})
+    return hourly.groupby(['pizza_name', 'hour'], observed=True, sort=False)['total_price'].sum().reset_index()
+
+
+def merge_hourly(*frames):
+    """Add hourly_revenue frames into one."""
+    return (pd.concat(frames, ignore_index=True)
+            .groupby(['pizza_name', 'hour'], observed=True, sort=False)['total_price'].sum()
+            .reset_index())
+
+
+def build_trend_matrix(df, grain='month'):
+    """Revenue of every pizza per period, one row per pizza_name, in one pivot_table pass.
+
+    df is an order table or its hourly_revenue. Columns run over every period
+    from the first order to the last.
+    """
+    if 'hour' not in df:
+        df = hourly_revenue(df)
+    freq, label = TREND_GRAINS[grain]
+    period = df['hour'].dt.to_period(freq).dt.start_time
+    matrix = df.assign(period=period).pivot_table(
+        index='pizza_name', columns='period', values='total_price',
+        aggfunc='sum', fill_value=0, observed=True)
+    if len(matrix.columns):
+        # Periods without orders (closed days) are zero, not missing
+        periods = pd.period_range(matrix.columns.min(), matrix.columns.max(), freq=freq)
+        matrix = matrix.reindex(columns=periods.start_time, fill_value=0)
+    matrix.index = matrix.index.astype(str)
+    matrix.columns = matrix.columns.strftime(label).rename(None)
+    return matrix.astype('float64').reset_index()
+
+
+def trend_path(csv_path, grain):
+    """Path of the persisted trend matrix of an order CSV at a granularity."""
+    return '%s_trend_%s.feather' % (os.path.splitext(csv_path)[0], grain)
+
+
+@st.cache_resource(max_entries=8)
+def _load_trend_matrix(path, mtime, grain):
+    # Rebuilt from the running hourly revenue, never from the whole order
+    # table, only once the order file is newer than the persisted copy
+    return read_columnar(trend_path(path, grain), path,
+                         lambda: build_trend_matrix(load_aggregates(path).hourly, grain))
+
+
+def load_trend_matrix(grain='month', path=SALES_PATH):
+    """Pizza by period revenue matrix derived from the order table.
+
+    Shaped like pizza_sales_time_range.csv, with chronological period columns,
+    and persisted as Feather per grain. Appends to the order file are folded
+    in incrementally, see load_aggregates.
+    """
+    return _load_trend_matrix(path, os.path.getmtime(path), grain)
+
+
+# Finest grain any EDA chart needs, as one cube per group of dimensions; every
+# chart frame is a rollup of one of them. Product and time dimensions are kept
+# apart, crossed they leave about one cell per order line
+CUBE_DIMENSIONS = {
+    'product': ['pizza_name', 'pizza_size', 'pizza_category', 'unit_price', 'total_price'],
+    'time': ['order_quarter', 'order_month', 'order_weekday', 'order_hour'],
+}
+
+CUBE_MEASURES = ['count', 'quantity', 'sales']
+
+
+def build_cube(df):
+    """Order lines, quantity and revenue per combination of each CUBE_DIMENSIONS group.
+
+    Returns a dict of cubes keyed like CUBE_DIMENSIONS. Rows with missing
+    dimension values are kept, so every cube adds up to the whole table.
+    """
+    # Widen the measures once, so sums cannot overflow the compact schema types
+    df = df.assign(quantity=df['quantity'].astype('int64'), sales=df['total_price'].astype('float64'))
+    return {name: (df.groupby(dimensions, observed=True, sort=False, dropna=False)
+                   .agg(count=('order_id', 'size'), quantity=('quantity', 'sum'), sales=('sales', 'sum'))
+                   .reset_index())
+            for name, dimensions in CUBE_DIMENSIONS.items()}
+
+# Order files at least this large count distinct orders with HyperLogLog
+CHUNKED_MIN_BYTES = 256 * 1024 ** 2
+CHUNK_ROWS = 200_000
+
+# Bytes before the folded offset compared on update, to tell appends from rewrites
+TAIL_BYTES = 1024
+
+# Seconds an order file must have been left alone before an unterminated last
+# line is taken for a whole row rather than one still being written
+SETTLE_SECONDS = 2.0
+
+
+def merge_cubes(*cubes):
+    """Add build_cube results cell by cell into one."""
+    merged = {}
+    for name, dimensions in CUBE_DIMENSIONS.items():
+        cube = (pd.concat([c[name] for c in cubes], ignore_index=True)
+                .groupby(dimensions, observed=True, sort=False, dropna=False)[CUBE_MEASURES].sum()
+                .reset_index())
+        # Chunks carry their own categories, so concat falls back to object columns
+        for col in dimensions:
+            if SALES_DTYPES.get(col) == 'category':
+                cube[col] = cube[col].astype('category')
+        merged[name] = cube
+    return merged
+
+
+class HyperLogLog:
+    """Distinct-count sketch in fixed memory (2 ** precision registers, ~1.04 / sqrt(m) error)."""
+
+    def __init__(self, precision=14):
+        self.precision = precision
+        self.registers = np.zeros(1 << precision, dtype=np.uint8)
+
+    def add(self, values):
+        hashes = pd.util.hash_array(np.asarray(values)).astype(np.uint64)
+        width = 64 - self.precision
+        index = (hashes >> np.uint64(width)).astype(np.int64)
+        rest = hashes & np.uint64((1 << width) - 1)
+
+        # Rank of the first set bit of the remaining bits, counted from the top
+        nonzero = rest > 0
+        top_bit = np.zeros(len(rest), dtype=np.int64)
+        top_bit[nonzero] = np.floor(np.log2(rest[nonzero].astype(np.float64))).astype(np.int64)
+        # float64 rounding can overshoot by one just below a power of two
+        over = nonzero & ((rest >> top_bit.astype(np.uint64)) == 0)
+        top_bit[over] -= 1
+        rank = np.where(nonzero, width - top_bit, width + 1).astype(np.uint8)
+
+        np.maximum.at(self.registers, index, rank)
+
+    def merge(self, other):
+        np.maximum(self.registers, other.registers, out=self.registers)
+
+    def __len__(self):
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / np.sum(np.exp2(-self.registers.astype(np.float64)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if estimate <= 2.5 * m and zeros:
+            # Linear counting is more accurate for small cardinalities
+            estimate = m * np.log(m / zeros)
+        return int(round(estimate))
+
+
+class SalesAggregates:
+    """Running aggregates of an order file: the cubes, its distinct orders and hourly revenue.
+
+    Fold chunks in with fold(); memory is bounded by the chunk and the cubes,
+    unless exact_orders keeps every order_id seen. header and offset record
+    how much of the file has been folded in and tail the bytes just before
+    offset, for update_sales.
+    """
+
+    def __init__(self, exact_orders=False):
+        self.cubes = None
+        self.hourly = None
+        self.orders = set() if exact_orders else HyperLogLog()
+        self.rows = 0
+        self.header = None
+        self.offset = 0
+        self.tail = b''
+
+    @property
+    def order_count(self):
+        return len(self.orders)
+
+    def fold(self, chunk):
+        chunk_cubes = build_cube(chunk)
+        self.cubes = chunk_cubes if self.cubes is None else merge_cubes(self.cubes, chunk_cubes)
+        chunk_hourly = hourly_revenue(chunk)
+        self.hourly = chunk_hourly if self.hourly is None else merge_hourly(self.hourly, chunk_hourly)
+        if isinstance(self.orders, set):
+            self.orders.update(chunk['order_id'].unique().tolist())
+        else:
+            self.orders.add(chunk['order_id'].to_numpy())
+        self.rows += len(chunk)
+        return self
+
+
+class _ByteWindow(io.RawIOBase):
+    """Readable view of bytes [start, end) of an open binary file."""
+
+    def __init__(self, f, start, end):
+        f.seek(start)
+        self.f = f
+        self.remaining = end - start
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        n = self.f.readinto(memoryview(buffer)[:min(len(buffer), self.remaining)])
+        self.remaining -= n
+        return n
+
+
+def _last_line_end(f, start, size, block=1 << 16):
+    # Offset just past the last newline in [start, size), so a line that is
+    # still being written is left for the next update
+    end = size
+    while end > start:
+        begin = max(start, end - block)
+        f.seek(begin)
+        newline = f.read(end - begin).rfind(b'\n')
+        if newline >= 0:
+            return begin + newline + 1
+        end = begin
+    return start
+
+
+def _read_tail(f, end, n, start):
+    # The up to n bytes before end, not reaching back before start
+    begin = max(start, end - n)
+    f.seek(begin)
+    return f.read(end - begin)
+
+
+def _last_row(f, columns, start, size):
+    # The unterminated line in [start, size) as a typed one-row frame, or None
+    # unless it has every column and parses
+    f.seek(start)
+    line = f.read(size - start)
+    try:
+        if len(next(csv.reader([line.decode()]), [])) != len(columns):
+            return None
+        return pd.read_csv(io.BytesIO(line), header=None, names=columns, dtype=SALES_DTYPES)
+    except (ValueError, csv.Error):
+        return None
+
+
+def _appended(aggregates, f, size):
+    # Whether the file only grew past the folded offset since the last update
+    header = f.readline()
+    if aggregates.header is None:
+        aggregates.header, aggregates.offset = header, len(header)
+        return True
+    if (header != aggregates.header or size < aggregates.offset
+            or _read_tail(f, aggregates.offset, len(aggregates.tail), len(header)) != aggregates.tail):
+        return False
+    if aggregates.tail[-1:] not in (b'', b'\n') and size > aggregates.offset:
+        # A folded unterminated row must be followed by a new line, not continued
+        f.seek(aggregates.offset)
+        return f.read(1) == b'\n'
+    return True
+
+
+def _new_rows(aggregates, f, stat, chunk_rows):
+    # Typed chunks of the rows past the folded offset, with the offset and tail
+    # they leave: every line ending in a newline, and an unterminated last line
+    # once the file has settled and it parses as a whole row
+    header = aggregates.header
+    columns = pd.read_csv(io.BytesIO(header)).columns
+    end = _last_line_end(f, aggregates.offset, stat.st_size)
+    last = None
+    if end < stat.st_size and time.time() - stat.st_mtime >= SETTLE_SECONDS:
+        last = _last_row(f, columns, end, stat.st_size)
+    offset = end if last is None else stat.st_size
+    tail = _read_tail(f, offset, TAIL_BYTES, len(header))
+
+    chunks = []
+    if end > aggregates.offset:
+        window = io.BufferedReader(_ByteWindow(f, aggregates.offset, end))
+        chunks = pd.read_csv(window, header=None, names=columns, dtype=SALES_DTYPES,
+                             chunksize=chunk_rows)
+    if last is not None:
+        chunks = itertools.chain(chunks, [last])
+    return chunks, offset, tail
+
+
+def update_sales(aggregates, path=SALES_PATH, chunk_rows=CHUNK_ROWS):
+    """Fold the rows appended to an order CSV since the last update.
+
+    Returns the number of new rows, or None when the file was rewritten rather
+    than appended to (changed header, shrunk, or different bytes before the
+    folded offset), in which case aggregates is left untouched and must be
+    rebuilt. Only rows ending in a newline are folded, a line still being
+    written waits for the next update. An unterminated last line is folded
+    once the file has not changed for SETTLE_SECONDS, if it parses.
+    """
+    with open(path, 'rb') as f:
+        stat = os.fstat(f.fileno())
+        if not _appended(aggregates, f, stat.st_size):
+            return None
+        chunks, offset, tail = _new_rows(aggregates, f, stat, chunk_rows)
+        rows = aggregates.rows
+        for chunk in chunks:
+            aggregates.fold(chunk)
+        aggregates.offset, aggregates.tail = offset, tail
+    return aggregates.rows - rows
+
+
+def _read_copy(path):
+    # Reader of the Feather copy of an order CSV and the header, offset and
+    # tail of the CSV bytes it holds, or None without a readable copy
+    try:
+        reader = pa.ipc.open_file(pa.memory_map(path))
+        meta = reader.schema.metadata or {}
+        return reader, (base64.b64decode(meta[b'csv_header']), int(meta[b'csv_offset']),
+                        base64.b64decode(meta[b'csv_tail']))
+    except (OSError, KeyError, ValueError, pa.ArrowException):
+        return None
+
+
+def _from_batch(batch):
+    # The copy keeps categories as plain strings, every chunk has its own
+    df = batch.to_pandas()
+    return df.astype({col: dtype for col, dtype in SALES_DTYPES.items() if col in df})
+
+
+class _CopyWriter:
+    """Streams record batches into a new Feather copy at path, swapped in on close().
+
+    Gives up on the first error, e.g. a read-only data directory or a chunk
+    whose inferred column types differ, and leaves any older copy in place.
+    """
+
+    def __init__(self, path, header, offset, tail):
+        self.path = path
+        self.tmp_path = '%s.%d.tmp' % (path, os.getpid())
+        self.metadata = {'csv_header': base64.b64encode(header), 'csv_offset': str(offset),
+                         'csv_tail': base64.b64encode(tail)}
+        self.sink = self.writer = None
+        self.failed = False
+
+    def write(self, rows):
+        if self.failed:
+            return
+        try:
+            if isinstance(rows, pd.DataFrame):
+                rows = pa.RecordBatch.from_pandas(
+                    rows.astype({col: object for col in rows.select_dtypes('category')}),
+                    preserve_index=False)
+            if self.writer is None:
+                # Uncompressed, so it can be memory-mapped
+                self.sink = pa.OSFile(self.tmp_path, 'wb')
+                self.writer = pa.ipc.new_file(self.sink, rows.schema.with_metadata(self.metadata))
+            self.writer.write_batch(rows)
+        except (OSError, pa.ArrowException):
+            self.abort()
+
+    def close(self):
+        if self.failed or self.writer is None:
+            return
+        try:
+            self.writer.close()
+            self.sink.close()
+            os.replace(self.tmp_path, self.path)
+        except OSError:
+            self.abort()
+
+    def abort(self):
+        self.failed = True
+        for stream in (self.writer, self.sink):
+            try:
+                if stream is not None:
+                    stream.close()
+            except (OSError, pa.ArrowException):
+                pass
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+
+def ingest_sales(path=SALES_PATH, chunk_rows=CHUNK_ROWS, exact_orders=False):
+    """Fold a whole order CSV into SalesAggregates.
+
+    The rows its Feather copy holds are read from there in record batches,
+    only the rows appended since are parsed from text, chunk_rows lines at a
+    time; the copy is then rewritten to hold those too. Without a copy, or
+    with one of a rewritten file, the whole CSV is parsed and the copy written.
+    """
+    aggregates = SalesAggregates(exact_orders)
+    copy_path = columnar_path(path)
+    with open(path, 'rb') as f:
+        stat = os.fstat(f.fileno())
+        copy = _read_copy(copy_path)
+        if copy is not None:
+            reader, (aggregates.header, aggregates.offset, aggregates.tail) = copy
+        if copy is None or not _appended(aggregates, f, stat.st_size):
+            reader = None
+            aggregates.header, aggregates.offset, aggregates.tail = None, 0, b''
+            f.seek(0)
+            _appended(aggregates, f, stat.st_size)
+
+        batches = (reader.get_batch(i) for i in range(reader.num_record_batches)) if reader else ()
+        chunks, offset, tail = _new_rows(aggregates, f, stat, chunk_rows)
+        if offset == aggregates.offset:
+            # The copy is up to date
+            for batch in batches:
+                aggregates.fold(_from_batch(batch))
+        else:
+            writer = _CopyWriter(copy_path, aggregates.header, offset, tail)
+            for batch in batches:
+                writer.write(batch)
+                aggregates.fold(_from_batch(batch))
+            for chunk in chunks:
+                writer.write(chunk)
+                aggregates.fold(chunk)
+            writer.close()
+        aggregates.offset, aggregates.tail = offset, tail
+    return aggregates
+
+
+@st.cache_resource
+def _live_aggregates(path):
+    # One running SalesAggregates per file and server process
+    return {'aggregates': None, 'lock': threading.Lock()}
+
+
+def load_aggregates(path=SALES_PATH):
+    """EDA aggregates of an order file, folding in only rows appended since last call.
+
+    Appends cost time proportional to the new rows; a rewritten file is
+    ingested again from the start. Orders are counted exactly for files
+    below CHUNKED_MIN_BYTES and with HyperLogLog above it.
+    """
+    state = _live_aggregates(path)
+    with state['lock']:
+        aggregates = state['aggregates']
+        if aggregates is None or update_sales(aggregates, path) is None:
+            exact_orders = os.path.getsize(path) < CHUNKED_MIN_BYTES
+            aggregates = state['aggregates'] = ingest_sales(path, exact_orders=exact_orders)
+    return aggregates
+
+
+def load_cube(name='product', path=SALES_PATH):
+    """An aggregation cube of the order table, kept up to date with appends."""
+    return load_aggregates(path).cubes[name]
+
+
+def cube_for(keys):
+    """Name of the cube whose dimensions cover keys."""
+    for name, dimensions in CUBE_DIMENSIONS.items():
+        if set(keys) <= set(dimensions):
+            return name
+    raise ValueError('No cube has all of %s' % (list(keys),))
+
+
+def load_order_count(path=SALES_PATH):
+    """Number of distinct orders, which cannot be rolled up from the cube.
+
+    Approximate (HyperLogLog) for files ingested in chunks.
+    """
+    return load_aggregates(path).order_count
+
+
+@st.cache_data(max_entries=64)
+def _rollup(path, mtime, keys, value):
+    # mtime keys the cache; the cube itself is brought up to date on load
+    cube = load_cube(cube_for(keys), path)
+    return cube.groupby(list(keys), observed=True)[value].sum().reset_index()
+
+
+def rollup(keys, value='count', path=SALES_PATH):
+    """Chart frame of a cube measure summed by keys, e.g. rollup(['pizza_size'], 'sales')."""
+    if isinstance(keys, str):
+        keys = [keys]
+    return _rollup(path, os.path.getmtime(path), tuple(keys), value)
@@ -0,0 +1,274 @@
+# Copyright (c) Streamlit Inc. (2018-2022) Snowflake Inc. (2022)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Trend engine of the Pizza Trend page: the pizza x period revenue matrix held
+# as a dense array over a real datetime axis, so a selection is a row gather
+# plus axis reductions and a date range is a column slice.
+
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from sales_data import (SALES_PATH, TIME_RANGE_PATH, data_version, load_time_range,
+                        load_trend_matrix)
+
+# Resolutions the page can resample to, finest first: period frequency and label
+RESOLUTIONS = {
+    'day': ('D', '%Y-%m-%d'),
+    'week': ('W', 'Week of %Y-%m-%d'),
+    'month': ('M', '%b %Y'),
+    'quarter': ('Q', 'Q%q %Y'),
+}
+
+# Most points per pizza sent to the browser, the resolution is coarsened to fit
+MAX_POINTS = 120
+
+# The shipped monthly export has month names only; it covers the 2015 orders
+TIME_RANGE_YEAR = 2015
+
+# Memory cap of the derived frames shared by all sessions
+FRAME_CACHE_BYTES = 64 * 1024 ** 2
+
+
+class TrendStore:
+    """Revenue of every pizza per period, with a name -> row index.
+
+    periods holds the start of each period as a sorted DatetimeIndex, at the
+    given resolution (a key of RESOLUTIONS). source identifies the data the
+    store was loaded from and, with the periods, makes up its cache key.
+    """
+
+    def __init__(self, names, periods, values, resolution='day', source=None):
+        self.names = list(names)
+        self.periods = pd.DatetimeIndex(periods)
+        self.values = np.asarray(values, dtype=np.float64)
+        self.resolution = resolution
+        self.source = source
+        self.row = {name: i for i, name in enumerate(self.names)}
+
+    @property
+    def key(self):
+        span = (self.periods[0], self.periods[-1]) if len(self.periods) else ()
+        return (self.source, self.resolution, len(self.periods)) + span
+
+    @classmethod
+    def from_frame(cls, df, resolution='day', date_format=None, source=None):
+        # One row per pizza_name, the other columns are periods in order
+        columns = [col for col in df.columns if col != 'pizza_name']
+        periods = pd.to_datetime(columns, format=date_format)
+        return cls(df['pizza_name'], periods, df[columns].to_numpy(), resolution, source)
+
+    def window(self, start, end):
+        """Periods starting between the start and end dates (inclusive), by slicing."""
+        lo = self.periods.searchsorted(pd.Timestamp(start))
+        hi = self.periods.searchsorted(pd.Timestamp(end) + pd.Timedelta(days=1))
+        return TrendStore(self.names, self.periods[lo:hi], self.values[:, lo:hi], self.resolution,
+                          self.source)
+
+    def resample(self, resolution):
+        """Sum periods into a coarser resolution, one np.add.reduceat over the columns."""
+        if resolution == self.resolution or not len(self.periods):
+            return TrendStore(self.names, self.periods, self.values, resolution, self.source)
+        freq = RESOLUTIONS[resolution][0]
+        buckets = self.periods.to_period(freq).start_time
+        # Periods are sorted, so every bucket is a contiguous run of columns
+        starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+        values = np.add.reduceat(self.values, starts, axis=1)
+        return TrendStore(self.names, buckets[starts], values, resolution, self.source)
+
+    def labels(self):
+        """Display label of every period."""
+        freq, fmt = RESOLUTIONS[self.resolution]
+        if self.resolution == 'quarter':
+            return list(self.periods.to_period(freq).strftime(fmt))
+        return list(self.periods.strftime(fmt))
+
+    def select(self, names):
+        """Rows of the selected pizzas, in selection order."""
+        return self.values[[self.row[name] for name in names]]
+
+    def selection_frames(self, names):
+        """Wide table, long-form lines and long-form totals of a selection.
+
+        Totals and shares are axis reductions over the gathered rows; the
+        long-form frames for Altair are built once from the result.
+        """
+        block = self.select(names)
+        totals = block.sum(axis=0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            shares = block / totals
+
+        labels = self.labels()
+        wide = pd.DataFrame(block, index=pd.Index(names, name='pizza_name'), columns=labels)
+        lines = pd.DataFrame({
+            'date': np.tile(self.periods, len(names)),
+            'period': np.tile(labels, len(names)),
+            'pizza_name': np.repeat(names, len(self.periods)),
+            'pizza_sales': block.ravel(),
+            'percentage': shares.ravel(),
+        })
+        total = pd.DataFrame({'date': self.periods, 'period': labels,
+                              'pizza_sales': totals, 'pizza_name': 'Total'})
+        return wide, lines, total
+
+
+def rolling_stats(values, window):
+    """Rolling analytics of every row of a pizzas x periods array in one vectorized pass.
+
+    Returns arrays shaped like values: moving_average over the trailing window
+    (current period included), growth over the previous period, zscore of each
+    period against the window of periods before it, and rank among all rows
+    in each period (1 is the best seller). Undefined cells are NaN.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    n, t = values.shape
+    # Prefix sums turn every window sum into one subtraction
+    sums = np.zeros((n, t + 1))
+    squares = np.zeros((n, t + 1))
+    np.cumsum(values, axis=1, out=sums[:, 1:])
+    np.cumsum(values ** 2, axis=1, out=squares[:, 1:])
+
+    end = np.arange(1, t + 1)
+    begin = np.maximum(end - window, 0)
+    moving_average = (sums[:, end] - sums[:, begin]) / (end - begin)
+
+    prev_end = end - 1
+    prev_begin = np.maximum(prev_end - window, 0)
+    prev_count = prev_end - prev_begin
+    with np.errstate(divide='ignore', invalid='ignore'):
+        prev_mean = (sums[:, prev_end] - sums[:, prev_begin]) / prev_count
+        prev_var = (squares[:, prev_end] - squares[:, prev_begin]) / prev_count - prev_mean ** 2
+        # Prefix-sum cancellation leaves tiny residues on flat series
+        prev_var[prev_var <= 1e-12 * prev_mean ** 2] = 0
+        zscore = (values - prev_mean) / np.sqrt(np.maximum(prev_var, 0))
+        growth = np.full_like(values, np.nan)
+        growth[:, 1:] = values[:, 1:] / values[:, :-1] - 1
+    zscore[:, prev_count < 2] = np.nan
+    zscore[~np.isfinite(zscore)] = np.nan
+    growth[~np.isfinite(growth)] = np.nan
+
+    rank = (-values).argsort(axis=0, kind='stable').argsort(axis=0, kind='stable') + 1
+    return {'moving_average': moving_average, 'growth': growth, 'zscore': zscore, 'rank': rank}
+
+
+@st.cache_data(max_entries=64, hash_funcs={TrendStore: lambda store: store.key})
+def selection_analytics(store, names, window, z_threshold=2.0):
+    """Long-form rolling analytics of the selected pizzas, cached per store, selection and window.
+
+    Computed over the whole catalog, so ranks are among every pizza.
+    """
+    stats = rolling_stats(store.values, window)
+    rows = [store.row[name] for name in names]
+    periods, labels = store.periods, store.labels()
+    frame = pd.DataFrame({
+        'date': np.tile(periods, len(names)),
+        'period': np.tile(labels, len(names)),
+        'pizza_name': np.repeat(names, len(periods)),
+        'pizza_sales': store.values[rows].ravel(),
+    })
+    for stat, array in stats.items():
+        frame[stat] = array[rows].ravel()
+    frame['anomaly'] = frame['zscore'].abs() > z_threshold
+    return frame
+
+
+class FrameCache:
+    """Thread-safe LRU of derived frames, bounded by total bytes, with hit/miss counters."""
+
+    def __init__(self, max_bytes=FRAME_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, build):
+        """Cached value of key, calling build() to make it on a miss."""
+        with self._lock:
+            if key in self._entries:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return self._entries[key][0]
+            self.misses += 1
+
+        value = build()
+        size = sum(int(frame.memory_usage(deep=True).sum()) for frame in value)
+        with self._lock:
+            if key not in self._entries and size <= self.max_bytes:
+                self._entries[key] = (value, size)
+                self.bytes += size
+                while self.bytes > self.max_bytes:
+                    _, (_, evicted) = self._entries.popitem(last=False)
+                    self.bytes -= evicted
+                    self.evictions += 1
+        return value
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'entries': len(self._entries),
+            'evictions': self.evictions,
+            'megabytes': self.bytes / 1024 ** 2,
+        }
+
+
+@st.cache_resource
+def frame_cache():
+    """The FrameCache shared by every session of this server process."""
+    return FrameCache()
+
+
+def shared_selection_frames(store, names):
+    """store.selection_frames(names) served from the cross-session frame cache.
+
+    The selection is sorted first, so every order of the same pizzas shares
+    one entry. The frames are shared, callers must not modify them.
+    """
+    names = sorted(names)
+    return frame_cache().get((store.key, tuple(names)), lambda: store.selection_frames(names))
+
+
+def pick_resolution(store, start, end, resolution=None, max_points=MAX_POINTS):
+    """Finest resolution, no finer than requested or stored, with at most max_points periods."""
+    names = list(RESOLUTIONS)
+    first = max(names.index(store.resolution), names.index(resolution or store.resolution))
+    for name in names[first:]:
+        if len(pd.period_range(start, end, freq=RESOLUTIONS[name][0])) <= max_points:
+            return name
+    return names[-1]
+
+
+@st.cache_resource(max_entries=4)
+def _load_store(path, version):
+    if path == TIME_RANGE_PATH:
+        df = load_time_range(path)
+        df = df.rename(columns=lambda col: col if col == 'pizza_name' else '%s %d' % (col, TIME_RANGE_YEAR))
+        return TrendStore.from_frame(df, 'month', date_format='%b %Y', source=(path, version))
+    return TrendStore.from_frame(load_trend_matrix('day', path), 'day', source=(path, version))
+
+
+def load_trend_store():
+    """Daily TrendStore of the order table, or the monthly one of the shipped export."""
+    if os.path.exists(SALES_PATH):
+        return _load_store(SALES_PATH, data_version(SALES_PATH))
+    return _load_store(TIME_RANGE_PATH, data_version(TIME_RANGE_PATH))